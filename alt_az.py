@@ -28,6 +28,8 @@ from typing import Dict, List, Tuple
 from constants import radius, transform, pos
 from constants import unit_deg, unit_rev, unit_mm, central_hole_size
 from graphics_context import BaseComponent, GraphicsContext
+from projection_tables import altitude_line, altitude_line_bounding_box, azimuth_line
+from projection_tables import bounding_box_altitude, window_edge_altitude
 from settings import fetch_command_line_arguments
 from text import text
 
@@ -43,6 +45,12 @@ class AltAzGrid(BaseComponent):
         """
         return "alt_az_grid"
 
+    def source_files(self) -> List[str]:
+        """
+        Return the files which the alt-az grid is drawn from.
+        """
+        return super().source_files() + ["curve_fitting.py", "projection_tables.py"]
+
     def bounding_box(self, settings: dict) -> Dict[str, float]:
         """
         Return the bounding box of the canvas area used by this component.
@@ -63,68 +71,52 @@ class AltAzGrid(BaseComponent):
         }
 
         # Trace around horizon, keeping track of minimum and maximum coordinates
-        alt_edge: float = -12
+        alt_edge: float = bounding_box_altitude(latitude=latitude)
+        extents: Dict[str, float] = altitude_line_bounding_box(alt=alt_edge, latitude=latitude)
 
-        # At latitudes very close to the equator, the point -12 degrees below the horizon is below dec -90!
-        if abs(latitude) < 15:
-            alt_edge = -9
+        bounding_box['x_min'] = min(bounding_box['x_min'], extents['x_min'])
+        bounding_box['x_max'] = max(bounding_box['x_max'], extents['x_max'])
+        bounding_box['y_min'] = min(bounding_box['y_min'], extents['y_min'])
+        bounding_box['y_max'] = max(bounding_box['y_max'], extents['y_max'])
 
-        path: List[Tuple[float, float]] = [
-            transform(alt=alt_edge, az=az, latitude=latitude) for az in arange(0, 360.5, 1)
-        ]
+        return bounding_box
 
-        for pt in path:
-            r_b: float = radius(dec=pt[1] / unit_deg, latitude=latitude)
-            position: Dict[str, float] = pos(r_b, pt[0])
-            bounding_box['x_min'] = min(bounding_box['x_min'], position['x'])
-            bounding_box['x_max'] = max(bounding_box['x_max'], position['x'])
-            bounding_box['y_min'] = min(bounding_box['y_min'], position['y'])
-            bounding_box['y_max'] = max(bounding_box['y_max'], position['y'])
+    @staticmethod
+    def window_edge(latitude: float) -> float:
+        """
+        Return the altitude of the line around the outer edge of the alt-az grid, which includes a margin for
+        gluing instructions.
 
-        return bounding_box
+        :param latitude:
+            The absolute latitude of the planisphere, degrees
+        :return:
+            Altitude, degrees
+        """
+        return window_edge_altitude(latitude=latitude)
 
-    def do_rendering(self, settings: dict, context: GraphicsContext) -> None:
+    @staticmethod
+    def draw_grid(context: GraphicsContext, latitude: float) -> None:
         """
-        This method is required to actually render this item.
+        Draw the parts of the alt-az grid which do not depend on the language: the horizon, the line to cut around
+        the edge of the window, and the lines of constant altitude and azimuth.
 
-        :param settings:
-            A dictionary of settings required by the renderer.
         :param context:
             A GraphicsContext object to use for drawing
+        :param latitude:
+            The absolute latitude of the planisphere, degrees
         :return:
             None
         """
 
-        latitude: float = abs(settings['latitude'])
-        language: str = settings['language']
-
-        context.set_font_size(0.9)
-
         # Set altitude of outer edge of alt-az grid, including margin for gluing instructions
-        alt_edge: float = -10
-        azimuth_step: float = 1
-
-        # At latitudes very close to the equator, the point -12 degrees below the horizon is below dec -90!
-        if abs(latitude) < 15:
-            alt_edge = -8
-            azimuth_step = 0.2
+        alt_edge: float = AltAzGrid.window_edge(latitude=latitude)
 
         # Draw horizon (altitude 0), and line to cut around edge of window (altitude alt_edge)
         alt: float
         for alt in (alt_edge, 0):
-            # Draw a line, segment by segment, taking small steps in azimuth
-            path: List[Tuple[float, float]] = [
-                transform(alt=alt, az=az, latitude=latitude) for az in arange(0, 360.5, azimuth_step)
-            ]
-
-            # Project line from RA, Dec into planispheric coordinates
+            # Draw a line as a smooth curve, fitted to the projection of a full circle in azimuth
             context.begin_path()
-            for i, p in enumerate(path):
-                r_b: float = radius(dec=p[1] / unit_deg, latitude=latitude)
-                if i == 0:
-                    context.move_to(**pos(r_b, p[0]))
-                else:
-                    context.line_to(**pos(r_b, p[0]))
+            context.bezier_curve(segments=altitude_line(alt=alt, latitude=latitude).tolist())
             context.stroke()
 
             if alt == alt_edge:
@@ -138,32 +130,48 @@ class AltAzGrid(BaseComponent):
 
         # Draw lines of constant altitude
         context.begin_path()
-        for alt in range(10, 85, 10):
-            path: List[Tuple[float, float]] = [
-                transform(alt=alt, az=az, latitude=latitude) for az in arange(0, 360.5, 1)
-            ]
-            for i, p in enumerate(path):
-                r_b: float = radius(dec=p[1] / unit_deg, latitude=latitude)
-                if i == 0:
-                    context.move_to(**pos(r_b, p[0]))
-                else:
-                    context.line_to(**pos(r_b, p[0]))
+        for alt in arange(10, 85, 10):
+            context.bezier_curve(segments=altitude_line(alt=alt, latitude=latitude).tolist())
         context.stroke(color=(0.5, 0.5, 0.5, 1))
 
         # Draw lines of constant azimuth, marking S,SSE,SE,ESE,E, etc
+        az: float
         context.begin_path()
         for az in arange(0, 359, 22.5):
-            path: List[Tuple[float, float]] = [
-                transform(alt=alt, az=az, latitude=latitude) for alt in arange(0, 90.1, 1)
-            ]
-            for i, p in enumerate(path):
-                r_b: float = radius(dec=p[1] / unit_deg, latitude=latitude)
-                if i == 0:
-                    context.move_to(**pos(r_b, p[0]))
-                else:
-                    context.line_to(**pos(r_b, p[0]))
+            context.bezier_curve(segments=azimuth_line(az=az, latitude=latitude).tolist())
         context.stroke(color=(0.5, 0.5, 0.5, 1))
 
+    def do_rendering(self, settings: dict, context: GraphicsContext) -> None:
+        """
+        This method is required to actually render this item.
+
+        :param settings:
+            A dictionary of settings required by the renderer.
+        :param context:
+            A GraphicsContext object to use for drawing
+        :return:
+            None
+        """
+
+        latitude: float = abs(settings['latitude'])
+        language: str = settings['language']
+
+        context.set_font_size(0.9)
+
+        # Draw the grid lines, which are the same in every language, so are only drawn once per latitude, and then
+        # reused for each translation
+        context.paint_layer(key=("AltAzGrid", "grid", latitude),
+                            bounding_box=self.bounding_box(settings=settings),
+                            renderer=lambda layer_context: self.draw_grid(context=layer_context, latitude=latitude))
+
+        # Text is clipped to the line around the edge of the window, excluding the central hole, like the grid
+        alt_edge: float = self.window_edge(latitude=latitude)
+        context.begin_path()
+        context.bezier_curve(segments=altitude_line(alt=alt_edge, latitude=latitude).tolist())
+        context.begin_sub_path()
+        context.circle(centre_x=0, centre_y=0, radius=central_hole_size)
+        context.clip()
+
         # Gluing labels
         def make_gluing_label(azimuth: float) -> None:
             pp: Tuple[float, float] = transform(alt=0, az=azimuth - 0.01, latitude=latitude)
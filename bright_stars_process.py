@@ -20,26 +20,113 @@
 This script takes the Yale Bright Star Catalogue, and formats it into a Python list. It also adds the names of objects.
 """
 
+import os
 import re
 
-from typing import Dict, Final, List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
 
-def fetch_bright_star_list() -> Dict[str, Union[list, dict]]:
+from disk_cache import cache_filename, save_array
+
+# The files that the catalogue is read from
+catalog_sources: Tuple[str, ...] = ("raw_data/bright_star_catalog.dat", "raw_data/bright_star_names.dat", __file__)
+
+
+def fixed_width_column(lines: np.ndarray, start: int, end: int) -> np.ndarray:
     """
-    Read the Yale Bright Star Catalogue from disk, and return it as a list of stars.
+    Extract a column of text from every line of a fixed-width text file.
 
+    :param lines:
+        Two-dimensional array of character codes, with one row for each line of the file
+    :param start:
+        The index of the first character of the column
+    :param end:
+        The index of the character after the end of the column
     :return:
-        Dictionary
+        Array of strings, with leading and trailing whitespace removed
     """
-    # Astronomical unit, in metres
-    au: Final[float] = 1.49598e11
+    column: np.ndarray = np.ascontiguousarray(lines[:, start:end]).view("S{:d}".format(end - start)).ravel()
+    return np.char.strip(column.astype("U{:d}".format(end - start)))
 
-    # Light year, in metres
-    lyr: Final[float] = 9.4605284e15
 
-    # Build a dictionary of stars, indexed by HD number
-    stars: Dict[int, Tuple[float, float, float, str, str, str, str]] = {}
+def parse_numeric_column(lines: np.ndarray, start: int, end: int,
+                         integer: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert a column of a fixed-width text file into numbers, working on the character codes of every line at once.
+    Entries are accepted if they consist of an optional sign, followed by digits with an optional decimal point,
+    and optionally surrounded by whitespace. Blank and malformed entries are flagged as invalid.
+
+    :param lines:
+        Two-dimensional array of character codes, with one row for each line of the file
+    :param start:
+        The index of the first character of the column
+    :param end:
+        The index of the character after the end of the column
+    :param integer:
+        Boolean flag indicating whether the column contains integers, in which case decimal points are not allowed
+    :return:
+        Array of numbers, and an array of Boolean flags indicating which entries were successfully converted
+    """
+    n: int = len(lines)
+    mantissa: np.ndarray = np.zeros(n, dtype=np.int64)
+    n_digits: np.ndarray = np.zeros(n, dtype=np.int64)
+    n_points: np.ndarray = np.zeros(n, dtype=np.int64)
+    n_fraction: np.ndarray = np.zeros(n, dtype=np.int64)
+    negative: np.ndarray = np.zeros(n, dtype=bool)
+    started: np.ndarray = np.zeros(n, dtype=bool)
+    finished: np.ndarray = np.zeros(n, dtype=bool)
+    valid: np.ndarray = np.ones(n, dtype=bool)
+
+    # Scan across the column one character at a time, processing that character for every line at once
+    position: int
+    for position in range(start, end):
+        chars: np.ndarray = np.ascontiguousarray(lines[:, position])
+
+        # Classify this character on every line
+        is_digit: np.ndarray = (chars >= ord('0')) & (chars <= ord('9'))
+        is_point: np.ndarray = chars == ord('.')
+        is_sign: np.ndarray = (chars == ord('+')) | (chars == ord('-'))
+        is_space: np.ndarray = (chars == ord(' ')) | (chars == ord('\n')) | (chars == ord('\r')) | (chars == 0)
+
+        # Entries must be a single contiguous run of text, where a sign may only appear as the first character
+        valid &= ~((is_digit | is_point | is_sign) & finished)
+        valid &= ~(is_sign & started)
+        valid &= is_digit | is_point | is_sign | is_space
+
+        # Assemble the digits into an integer mantissa, and count how many come after the decimal point
+        mantissa = np.where(is_digit, mantissa * 10 + (chars.astype(np.int64) - ord('0')), mantissa)
+        n_digits += is_digit
+        n_fraction += is_digit & (n_points > 0)
+        n_points += is_point
+        negative |= chars == ord('-')
+
+        finished |= is_space & started
+        started |= ~is_space
+
+    valid &= (n_digits > 0) & (n_points <= (0 if integer else 1))
+    mantissa = np.where(negative, -mantissa, mantissa)
+
+    if integer:
+        return np.where(valid, mantissa, 0), valid
+
+    # Dividing the exact integer mantissa by a power of ten gives the same correctly-rounded result as float()
+    return np.where(valid, mantissa / 10. ** n_fraction, 0.), valid
+
+
+def parse_bright_star_catalog(catalog_filename: str = "raw_data/bright_star_catalog.dat",
+                              names_filename: str = "raw_data/bright_star_names.dat") -> np.ndarray:
+    """
+    Parse the text files of the Yale Bright Star Catalogue. The fixed-width columns of the catalogue are decoded for
+    all stars at once, so this also copes with much larger catalogues in the same format.
+
+    :param catalog_filename:
+        The filename of the fixed-width catalogue of stars
+    :param names_filename:
+        The filename of the list of the common names of stars, indexed by HR number
+    :return:
+        Structured array of stars, sorted by HD number
+    """
 
     # Convert three-letter abbreviations of Greek letters into UTF-8
     greek_alphabet: Dict[str, str] = {
@@ -54,7 +141,7 @@ def fetch_bright_star_list() -> Dict[str, Union[list, dict]]:
 
     # Look up the common names of bright stars
     star_names: Dict[int, str] = {}
-    with open("raw_data/bright_star_names.dat", "rt") as f_in:
+    with open(names_filename, "rt") as f_in:
         for line in f_in:
             # Ignore blank lines and comment lines
             if (len(line) < 5) or (line[0] == '#'):
@@ -66,82 +153,287 @@ def fetch_bright_star_list() -> Dict[str, Union[list, dict]]:
             name: str = line[5:]
             star_names[bs_num] = re.sub(' ', '_', name.strip())
 
-    # Loop through the Yale Bright Star Catalog, line by line
-    bs_num: int = 0
-    with open("raw_data/bright_star_catalog.dat", "rt") as f_in:
-        for line in f_in:
-            # Ignore blank lines and comment lines
-            if (len(line) < 100) or (line[0] == '#'):
-                continue
+    # Read the whole of the Yale Bright Star Catalog, and arrange it into a two-dimensional array of characters
+    with open(catalog_filename, "rb") as f_in:
+        all_lines: np.ndarray = np.array(f_in.read().splitlines(keepends=True), dtype=bytes)
+    line_lengths: np.ndarray = np.char.str_len(all_lines)
+    lines: np.ndarray = all_lines.view(np.uint8).reshape((len(all_lines), all_lines.dtype.itemsize))
+
+    # Ignore blank lines and comment lines
+    lines = lines[(line_lengths >= 100) & (lines[:, 0] != ord('#'))]
+
+    # The bright star number -- i.e. the HR number -- of each star is its position in the catalogue
+    bs_num: np.ndarray = np.arange(1, len(lines) + 1)
+
+    # Read the Henry Draper (i.e. HD) number of each star
+    hd, valid = parse_numeric_column(lines, 25, 31, integer=True)
+
+    # Read the right ascension of each star (J2000)
+    ra_hrs, valid_ra_hrs = parse_numeric_column(lines, 75, 77)
+    ra_min, valid_ra_min = parse_numeric_column(lines, 77, 79)
+    ra_sec, valid_ra_sec = parse_numeric_column(lines, 79, 82)
+
+    # Read the declination of each star (J2000)
+    dec_neg: np.ndarray = lines[:, 83] == ord('-')
+    dec_deg, valid_dec_deg = parse_numeric_column(lines, 84, 86)
+    dec_min, valid_dec_min = parse_numeric_column(lines, 86, 88)
+    dec_sec, valid_dec_sec = parse_numeric_column(lines, 88, 90)
+
+    # Read the V magnitude of each star
+    mag, valid_mag = parse_numeric_column(lines, 102, 107)
+
+    # Discard stars with any of these fields missing
+    valid &= valid_ra_hrs & valid_ra_min & valid_ra_sec & valid_dec_deg & valid_dec_min & valid_dec_sec & valid_mag
+
+    # Turn RA and Dec from sexagesimal units into decimal
+    ra: np.ndarray = (ra_hrs + ra_min / 60 + ra_sec / 3600) / 24 * 360
+    dec: np.ndarray = (dec_deg + dec_min / 60 + dec_sec / 3600)
+    dec = np.where(dec_neg, -dec, dec)
+
+    # Where several entries share a HD number, the last one takes precedence
+    hd_valid: np.ndarray = hd[valid]
+    last_entries: np.ndarray
+    _, last_entries = np.unique(hd_valid[::-1], return_index=True)
+    selection: np.ndarray = np.flatnonzero(valid)[len(hd_valid) - 1 - last_entries]
+
+    # We only need to work out the names of the stars we are keeping
+    lines = lines[selection]
+    bs_num = bs_num[selection]
+
+    # Look up the Bayer number of each star, if one exists
+    star_num, valid_star_num = parse_numeric_column(lines, 4, 7, integer=True)
+    star_num[~valid_star_num] = -1
+
+    # Look up the Greek letter (Flamsteed designation) of each star, and the constellation it is in
+    greek: np.ndarray = fixed_width_column(lines, 7, 10)
+    const: np.ndarray = fixed_width_column(lines, 11, 14)
+
+    # Some stars have a suffix after the Flamsteed designation, e.g. alpha-1, alpha-2, etc.
+    greek_letter_suffix: np.ndarray = lines[:, 10].copy().view("S1").astype("U1")
+
+    # Render unicode strings containing the Flamsteed and Bayer designations of each star. We only need to translate
+    # each distinct abbreviation once.
+    greek_codes, greek_index = np.unique(greek, return_inverse=True)
+    suffix_codes, suffix_index = np.unique(greek_letter_suffix, return_inverse=True)
+    has_greek: np.ndarray = np.array([code in greek_alphabet for code in greek_codes], dtype=bool)[greek_index]
+    name_bayer: np.ndarray = np.char.add(
+        np.array([greek_alphabet.get(code, "-") for code in greek_codes])[greek_index],
+        np.array([star_suffices.get(code, "") for code in suffix_codes])[suffix_index]
+    )
+    name_bayer = np.where(has_greek, name_bayer, "-")
+    name_bayer_full: np.ndarray = np.where(has_greek, np.char.add(np.char.add(name_bayer, "-"), const), "-")
+    name_flamsteed_full: np.ndarray = np.where(star_num > 0,
+                                               np.char.add(np.char.add(star_num.astype(str), "-"), const), "-")
+
+    # See which stars have names
+    names_by_bs_num: np.ndarray = np.full(max([int(bs_num.max(initial=0))] + list(star_names.keys())) + 1, "-",
+                                          dtype="U{:d}".format(max([1] + [len(i) for i in star_names.values()])))
+    names_by_bs_num[list(star_names.keys())] = list(star_names.values())
+    name_english: np.ndarray = names_by_bs_num[bs_num]
+
+    # Make string columns just wide enough for the longest name in each
+    def string_column(column: np.ndarray) -> np.ndarray:
+        return column.astype("U{:d}".format(max(1, np.char.str_len(column).max(initial=1))))
+
+    columns: Dict[str, np.ndarray] = {
+        'hd': hd[selection].astype(np.int32),
+        'ra': ra[selection],
+        'dec': dec[selection],
+        'mag': mag[selection],
+        'name_bayer': string_column(name_bayer),
+        'name_bayer_full': string_column(name_bayer_full),
+        'name_english': string_column(name_english),
+        'name_flamsteed_full': string_column(name_flamsteed_full)
+    }
+
+    stars: np.ndarray = np.zeros(len(selection), dtype=[(key, value.dtype) for key, value in columns.items()])
+    key: str
+    value: np.ndarray
+    for key, value in columns.items():
+        stars[key] = value
+    return stars
+
+
+# The names of the columns in which the designations of each star are stored
+name_columns: Tuple[str, ...] = ("name_bayer", "name_bayer_full", "name_english", "name_flamsteed_full")
+
 
-            # Counter used too calculated the bright star number -- i.e. the HR number -- of each star
-            bs_num += 1
-            try:
-                # Read the Henry Draper (i.e. HD) number for this star
-                hd: int = int(line[25:31])
-
-                # Read the right ascension of this star (J2000)
-                ra_hrs: float = float(line[75:77])
-                ra_min: float = float(line[77:79])
-                ra_sec: float = float(line[79:82])
-
-                # Read the declination of this star (J2000)
-                dec_neg: bool = (line[83] == '-')
-                dec_deg: float = float(line[84:86])
-                dec_min: float = float(line[86:88])
-                dec_sec: float = float(line[88:90])
-
-                # Read the V magnitude of this star
-                mag: float = float(line[102:107])
-            except ValueError:
+class StarCatalog:
+    """
+    A catalogue of stars, stored as columns. The positions and magnitudes of the stars are held in contiguous arrays
+    of floats, and the names of the stars are stored separately, and only loaded when they are first needed.
+
+    Stars are stored in order of increasing magnitude, and indexed by declination band, so that we can quickly find
+    the stars brighter than some limiting magnitude within some range of declinations.
+    """
+
+    # Width of the declination bands used to index the catalogue, degrees
+    dec_band_width: float = 10
+
+    def __init__(self, columns_filename: str, names_filename: str):
+        """
+        A catalogue of stars, stored as columns.
+
+        :param columns_filename:
+            The filename of a binary file containing a two-dimensional array, whose rows are the HD numbers, right
+            ascensions, declinations and magnitudes of the stars, sorted by magnitude
+        :param names_filename:
+            The filename of a binary file containing a structured array of the names of the stars, in the same order
+        """
+        columns: np.ndarray = np.load(columns_filename, mmap_mode='r', allow_pickle=False)
+
+        self.names_filename: str = names_filename
+        self._names: Optional[np.ndarray] = None
+
+        # HD numbers of the stars
+        self.hd: np.ndarray = columns[0].astype(np.int64)
+
+        # Right ascensions of the stars (J2000), degrees
+        self.ra: np.ndarray = columns[1]
+
+        # Declinations of the stars (J2000), degrees
+        self.dec: np.ndarray = columns[2]
+
+        # V magnitudes of the stars, in ascending order
+        self.mag: np.ndarray = columns[3]
+
+        # Index of the stars in order of HD number, so that we can look stars up by HD number
+        self.hd_order: np.ndarray = np.argsort(self.hd, kind='stable')
+        self.hd_sorted: np.ndarray = self.hd[self.hd_order]
+
+        # Indices of the stars in each declination band, in order of increasing magnitude
+        band_count: int = int(np.ceil(180 / self.dec_band_width))
+        bands: np.ndarray = np.clip(((self.dec + 90) // self.dec_band_width).astype(np.int64), 0, band_count - 1)
+        band_order: np.ndarray = np.argsort(bands, kind='stable')
+        self.dec_bands: List[np.ndarray] = np.split(band_order,
+                                                    np.searchsorted(bands[band_order], np.arange(1, band_count)))
+
+    def __len__(self) -> int:
+        return len(self.hd)
+
+    @property
+    def names(self) -> np.ndarray:
+        """
+        Structured array of the names of the stars, with the columns listed in <name_columns>. This is loaded from
+        disk the first time it is used.
+        """
+        if self._names is None:
+            self._names = np.load(self.names_filename, mmap_mode='r', allow_pickle=False)
+        return self._names
+
+    def query(self, mag_max: float, dec_min: float = -90, dec_max: float = 90) -> np.ndarray:
+        """
+        Find the stars brighter than some limiting magnitude, within a range of declinations.
+
+        :param mag_max:
+            The faintest magnitude to include
+        :param dec_min:
+            The most southerly declination to include, degrees
+        :param dec_max:
+            The most northerly declination to include, degrees
+        :return:
+            Indices into the columns of this catalogue, in order of increasing magnitude
+        """
+        selection: List[np.ndarray] = []
+
+        band: int
+        members: np.ndarray
+        for band, members in enumerate(self.dec_bands):
+            band_min: float = band * self.dec_band_width - 90
+            band_max: float = band_min + self.dec_band_width
+            if band_max < dec_min or band_min > dec_max:
                 continue
 
-            # Look up the Bayer number of this star, if one exists
-            star_num: int = -1
-            try:
-                star_num = int(line[4:7])
-            except ValueError:
-                pass
-
-            # Render a unicode string containing the name, Flamsteed designation, and Bayer designation for this star
-            name_bayer: str = "-"
-            name_bayer_full: str = "-"
-            name_english: str = "-"
-            name_flamsteed_full: str = "-"
-
-            # Look up the Greek letter (Flamsteed designation) of this star
-            greek: str = line[7:10].strip()
-
-            # Look up the abbreviation of the constellation this star is in
-            const: str = line[11:14].strip()
-
-            # Some stars have a suffix after the Flamsteed designation, e.g. alpha-1, alpha-2, etc.
-            greek_letter_suffix: str = line[10]
-            if greek in greek_alphabet:
-                name_bayer: str = greek_alphabet[greek]
-                if greek_letter_suffix in star_suffices:
-                    name_bayer += star_suffices[greek_letter_suffix]
-                name_bayer_full: str = '{}-{}'.format(name_bayer, const)
-            if star_num > 0:
-                name_flamsteed_full: str = '{}-{}'.format(star_num, const)
-
-            # See if this is a star with a name
-            if bs_num in star_names:
-                name_english: str = star_names[bs_num]
-
-            # Turn RA and Dec from sexagesimal units into decimal
-            ra: float = (ra_hrs + ra_min / 60 + ra_sec / 3600) / 24 * 360
-            dec: float = (dec_deg + dec_min / 60 + dec_sec / 3600)
-            if dec_neg:
-                dec = -dec
-
-            # Build a dictionary is stars, indexed by HD number
-            stars[hd] = (ra, dec, mag, name_bayer, name_bayer_full, name_english, name_flamsteed_full)
-
-    hd_numbers: List[int] = list(stars.keys())
-    hd_numbers.sort()
+            # Within each band, stars are sorted by magnitude, so the bright ones come first
+            members = members[:np.searchsorted(self.mag[members], mag_max, side='right')]
+
+            # Bands which straddle the ends of the range of declinations need to be filtered star by star
+            if band_min < dec_min or band_max > dec_max:
+                members = members[(self.dec[members] >= dec_min) & (self.dec[members] <= dec_max)]
+
+            selection.append(members)
+
+        return np.sort(np.concatenate(selection)) if selection else np.zeros(0, dtype=np.int64)
+
+    def index_of(self, hd: int) -> int:
+        """
+        Look up the position of a star in the columns of this catalogue.
+
+        :param hd:
+            The HD number of the star
+        :return:
+            Index into the columns of this catalogue
+        """
+        position: int = int(np.searchsorted(self.hd_sorted, hd))
+        if position >= len(self.hd_sorted) or self.hd_sorted[position] != hd:
+            raise KeyError("No star with HD number {}".format(hd))
+        return int(self.hd_order[position])
+
+    def star(self, hd: int) -> Tuple[float, float, float, str, str, str, str]:
+        """
+        Look up a star by its HD number.
+
+        :param hd:
+            The HD number of the star
+        :return:
+            Tuple of the right ascension, declination, magnitude, and the names listed in <name_columns>
+        """
+        index: int = self.index_of(hd=hd)
+        return ((float(self.ra[index]), float(self.dec[index]), float(self.mag[index])) +
+                tuple(self.names[index].tolist()))
+
+
+# Catalogues we have already loaded, indexed by the filename of their cache
+star_catalogs: Dict[str, StarCatalog] = {}
+
+
+def fetch_bright_star_catalog() -> StarCatalog:
+    """
+    Return the Yale Bright Star Catalogue. The parsed catalogue is stored in a binary cache, and memory-mapped on
+    subsequent calls, until the text files it is parsed from change.
+
+    :return:
+        StarCatalog instance
+    """
+    columns_filename: str = cache_filename(name="bright_star_catalog", files=catalog_sources)
+    names_filename: str = cache_filename(name="bright_star_names", files=catalog_sources)
+
+    if columns_filename in star_catalogs:
+        return star_catalogs[columns_filename]
+
+    # If the cache is missing, then parse the catalogue and populate it. The names are written first, so that
+    # whenever the file of columns exists, so does the file of names.
+    if not (os.path.exists(columns_filename) and os.path.exists(names_filename)):
+        stars: np.ndarray = parse_bright_star_catalog()
+        stars = stars[np.lexsort((stars['hd'], stars['mag']))]
+        save_array(filename=names_filename, array=stars[list(name_columns)])
+        save_array(filename=columns_filename, array=np.array([stars['hd'], stars['ra'], stars['dec'], stars['mag']],
+                                                             dtype=np.float64))
+
+    star_catalogs[columns_filename] = StarCatalog(columns_filename=columns_filename, names_filename=names_filename)
+    return star_catalogs[columns_filename]
+
+
+def fetch_bright_star_list() -> Dict[str, Union[list, dict]]:
+    """
+    Read the Yale Bright Star Catalogue from disk, and return it as a list of stars.
+
+    :return:
+        Dictionary
+    """
+
+    catalog: StarCatalog = fetch_bright_star_catalog()
+
+    # Build a dictionary of stars, indexed by HD number
+    order: np.ndarray = catalog.hd_order
+    stars: Dict[int, Tuple[float, float, float, str, str, str, str]] = {
+        hd: (ra, dec, mag) + tuple(names)
+        for hd, ra, dec, mag, names in zip(catalog.hd[order].tolist(), catalog.ra[order].tolist(),
+                                           catalog.dec[order].tolist(), catalog.mag[order].tolist(),
+                                           catalog.names[order].tolist())
+    }
 
     return {
         'stars': stars,
-        'hd_numbers': hd_numbers
+        'hd_numbers': catalog.hd_sorted.tolist()
     }
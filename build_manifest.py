@@ -0,0 +1,130 @@
+# build_manifest.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+Keep a manifest of the inputs from which each output file was built, so that a rebuild only needs to regenerate the
+outputs whose inputs have changed.
+"""
+
+import json
+import os
+
+from typing import Dict, Optional, Sequence
+
+from disk_cache import hash_inputs
+from graphics_context import BaseComponent
+from text import text
+from themes import themes
+
+
+def component_digest(component: BaseComponent) -> str:
+    """
+    Compute a digest of all the inputs to a component of the planisphere: its settings, its source code and data
+    files, and the entries in <text.py> and <themes.py> which it uses.
+
+    :param component:
+        The component to compute a digest for
+    :return:
+        Hexadecimal digest string
+    """
+    return hash_inputs(files=component.source_files(), values=component_settings(component=component))
+
+
+def component_settings(component: BaseComponent) -> list:
+    """
+    List all the inputs to a component of the planisphere other than its source code and data files: its type, its
+    settings, and the entries in <text.py> and <themes.py> which it uses.
+
+    :param component:
+        The component to list the inputs of
+    :return:
+        List of JSON-serialisable values
+    """
+    settings: dict = component.settings
+
+    return [type(component).__name__,
+            settings,
+            text.get(settings.get('language'), {}),
+            themes.get(settings.get('theme'), {})
+            ]
+
+
+class BuildManifest:
+    """
+    A record, stored on disk, of the digest of the inputs from which each output file was built.
+    """
+
+    def __init__(self, filename: str = "output/manifest.json"):
+        """
+        A record, stored on disk, of the digest of the inputs from which each output file was built.
+
+        :param filename:
+            The filename of the JSON file in which the manifest is stored
+        """
+        self.filename: str = filename
+        self.entries: Dict[str, str] = {}
+
+        # Read the manifest from the previous build, if there is one
+        if os.path.exists(filename):
+            try:
+                with open(filename, "rt") as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    @staticmethod
+    def is_current(entries: Dict[str, str], outputs: Sequence[str], digest: str) -> bool:
+        """
+        Check whether a set of output files exists, and were all built from inputs with a particular digest.
+
+        :param entries:
+            The entries of the manifest
+        :param outputs:
+            The filenames of the output files
+        :param digest:
+            The digest of the inputs which the output files should have been built from
+        :return:
+            Boolean flag indicating whether the outputs are up to date
+        """
+        return all(entries.get(output) == digest and os.path.exists(output) for output in outputs)
+
+    def update(self, entries: Optional[Dict[str, str]]) -> None:
+        """
+        Record the digests of the inputs of a set of newly-built output files.
+
+        :param entries:
+            Dictionary of digests, indexed by output filename
+        :return:
+            None
+        """
+        if entries:
+            self.entries.update(entries)
+
+    def save(self) -> None:
+        """
+        Write the manifest to disk. The file is replaced in a single step, so that an interrupted build never leaves
+        a half-written manifest behind.
+
+        :return:
+            None
+        """
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        tmp_filename: str = "{}.tmp{:d}".format(self.filename, os.getpid())
+        with open(tmp_filename, "wt") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_filename, self.filename)
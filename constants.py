@@ -20,7 +20,10 @@
 The file contains global settings for the planisphere.
 """
 
-from math import pi, sin, cos, atan2, asin
+import numpy as np
+
+from math import pi, sin, cos
+from numpy.typing import ArrayLike
 from typing import Dict, Tuple
 
 # Units
@@ -59,7 +62,11 @@ inclination_ecliptic: float = 23.5
 r_2: float = r_1 - r_gap
 
 
-def radius(dec: float, latitude: float) -> float:
+def radius_array(dec: ArrayLike, latitude: float) -> np.ndarray:
+    """
+    Project an array of declinations into radii from the centre of the star chart.
+    """
+    dec = np.asarray(dec, dtype=float)
     dec_span: float = (90 + (90 - latitude)) * 1.125
     if latitude >= 0:
         return (90 - dec) / dec_span * r_2
@@ -67,18 +74,38 @@ def radius(dec: float, latitude: float) -> float:
         return (90 + dec) / dec_span * r_2
 
 
-def transform(alt: float, az: float, latitude: float) -> Tuple[float, float]:
-    alt *= unit_deg
-    az *= unit_deg
+def radius(dec: float, latitude: float) -> float:
+    return float(radius_array(dec=dec, latitude=latitude))
+
+
+def declination(r: float, latitude: float) -> float:
+    """
+    The inverse of <radius>: the declination which is drawn at a given radius from the centre of the star chart.
+    """
+    dec_span: float = (90 + (90 - latitude)) * 1.125
+    if latitude >= 0:
+        return 90 - r / r_2 * dec_span
+    else:
+        return r / r_2 * dec_span - 90
+
+
+def transform_array(alt: ArrayLike, az: ArrayLike, latitude: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert arrays of altitudes and azimuths, in degrees, into right ascensions and declinations, in radians. The
+    input arrays are broadcast against each other, so a whole sweep of azimuths can be projected at a single
+    altitude, or a grid of altitudes and azimuths can be projected at once.
+    """
+    alt = np.asarray(alt, dtype=float) * unit_deg
+    az = np.asarray(az, dtype=float) * unit_deg
     l: float = (90 - latitude) * unit_deg
-    x: float = cos(alt) * sin(az)
-    y: float = cos(alt) * cos(az)
-    z: float = sin(alt)
-    x2: float = x * cos(l) - z * sin(l)
-    y2: float = y
-    z2: float = x * sin(l) + z * cos(l)
-    ra: float = atan2(x2, y2)
-    dec: float = asin(z2)
+    x: np.ndarray = np.cos(alt) * np.sin(az)
+    y: np.ndarray = np.cos(alt) * np.cos(az)
+    z: np.ndarray = np.sin(alt)
+    x2: np.ndarray = x * cos(l) - z * sin(l)
+    y2: np.ndarray = y
+    z2: np.ndarray = x * sin(l) + z * cos(l)
+    ra: np.ndarray = np.arctan2(x2, y2)
+    dec: np.ndarray = np.arcsin(np.clip(z2, -1, 1))
 
     # Put south pole at the centre of southern planispheres
     if latitude < 0:
@@ -86,5 +113,20 @@ def transform(alt: float, az: float, latitude: float) -> Tuple[float, float]:
     return ra, dec
 
 
+def transform(alt: float, az: float, latitude: float) -> Tuple[float, float]:
+    ra, dec = transform_array(alt=alt, az=az, latitude=latitude)
+    return float(ra), float(dec)
+
+
+def pos_array(r: ArrayLike, t: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert arrays of polar coordinates into arrays of x and y positions.
+    """
+    r = np.asarray(r, dtype=float)
+    t = np.asarray(t, dtype=float)
+    return r * np.cos(t), -r * np.sin(-t)
+
+
 def pos(r: float, t: float) -> Dict[str, float]:
-    return {'x': r * cos(t), 'y': -r * sin(-t)}
+    x, y = pos_array(r=r, t=t)
+    return {'x': float(x), 'y': float(y)}
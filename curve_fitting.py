@@ -0,0 +1,206 @@
+# curve_fitting.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+Approximate smooth curves, such as lines of constant altitude or azimuth projected onto the planisphere, with a small
+number of cubic Bézier segments, rather than with hundreds of short straight lines.
+
+Each segment is a cubic Hermite interpolant between two points on the curve, matching the curve's position and
+tangent at both ends. Segments which deviate from the curve by more than a given tolerance are split in half, and
+refitted, until every segment is within tolerance. Curves which cannot be fitted to within tolerance, e.g. because they
+have a kink or pass through a singularity of the projection, raise a <CurveFittingError>.
+"""
+
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from constants import unit_deg, unit_mm, radius_array, transform_array, pos_array
+
+# A parametric curve, which maps an array of parameter values onto arrays of x and y positions, metres
+ParametricCurve = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+# The default maximum distance between a fitted curve and the true curve: well below what can be seen in print
+default_tolerance: float = 0.01 * unit_mm
+
+# The positions along each segment, as fractions of its length, where its deviation from the true curve is measured
+sample_fractions: np.ndarray = np.arange(1, 8) / 8
+
+
+class CurveFittingError(Exception):
+    """
+    Exception raised when a curve cannot be fitted to within tolerance.
+    """
+    pass
+
+
+def fit_bezier_curve(curve: ParametricCurve, t_min: float, t_max: float, tolerance: float = default_tolerance,
+                     initial_segments: int = 4, max_depth: int = 12) -> np.ndarray:
+    """
+    Approximate a smooth parametric curve with a sequence of cubic Bézier segments, to within a given tolerance.
+
+    :param curve:
+        The curve to approximate. This is called with arrays of parameter values of any shape.
+    :param t_min:
+        The parameter value at the start of the curve
+    :param t_max:
+        The parameter value at the end of the curve
+    :param tolerance:
+        The maximum distance between the fitted segments and the curve, metres
+    :param initial_segments:
+        The number of equal segments the curve is divided into before any are split
+    :param max_depth:
+        The maximum number of times a segment may be split in half. If any segment is still not within tolerance
+        after being split this many times, e.g. where the curve has a kink, a <CurveFittingError> is raised.
+    :return:
+        Array with one row for each segment, in order along the curve, containing its start point, two control points
+        and end point as [x0, y0, x1, y1, x2, y2, x3, y3], metres
+    """
+
+    # Step used to estimate the tangent to the curve by finite differences
+    step: float = abs(t_max - t_min) * 1e-7
+
+    # The intervals of parameter value which remain to be fitted
+    t0: np.ndarray = np.linspace(t_min, t_max, initial_segments + 1)[:-1]
+    t1: np.ndarray = np.linspace(t_min, t_max, initial_segments + 1)[1:]
+
+    fitted_start: List[np.ndarray] = []
+    fitted_segments: List[np.ndarray] = []
+
+    depth: int
+    for depth in range(max_depth + 1):
+        span: np.ndarray = t1 - t0
+
+        # Position and tangent at each end of each interval, with the tangent scaled to the length of the interval
+        x0, y0 = curve(t0)
+        x3, y3 = curve(t1)
+        xa, ya = curve(np.concatenate([t0 + step, t1 + step]))
+        xb, yb = curve(np.concatenate([t0 - step, t1 - step]))
+        dx: np.ndarray = (xa - xb) / (2 * step) * np.tile(span, 2) / 3
+        dy: np.ndarray = (ya - yb) / (2 * step) * np.tile(span, 2) / 3
+
+        # The control points of the cubic Hermite interpolant between the ends of each interval
+        count: int = len(t0)
+        x1: np.ndarray = x0 + dx[:count]
+        y1: np.ndarray = y0 + dy[:count]
+        x2: np.ndarray = x3 - dx[count:]
+        y2: np.ndarray = y3 - dy[count:]
+
+        # Compare each segment with the true curve at a few points along its length
+        u: np.ndarray = sample_fractions[None, :]
+        xs, ys = curve(t0[:, None] + span[:, None] * u)
+        weights: Tuple[np.ndarray, ...] = ((1 - u) ** 3, 3 * (1 - u) ** 2 * u, 3 * (1 - u) * u ** 2, u ** 3)
+        xf: np.ndarray = (weights[0] * x0[:, None] + weights[1] * x1[:, None] +
+                          weights[2] * x2[:, None] + weights[3] * x3[:, None])
+        yf: np.ndarray = (weights[0] * y0[:, None] + weights[1] * y1[:, None] +
+                          weights[2] * y2[:, None] + weights[3] * y3[:, None])
+        error: np.ndarray = np.hypot(xf - xs, yf - ys).max(axis=1)
+
+        # Keep the segments which are good enough, and split the others in half
+        accept: np.ndarray = error <= tolerance
+        if depth == max_depth and not np.all(accept):
+            raise CurveFittingError("Could not fit curve to within {:.3g} mm after splitting it {:d} times; the worst "
+                                    "segment is {:.3g} mm out".format(tolerance / unit_mm, max_depth,
+                                                                      error[~accept].max() / unit_mm))
+        fitted_start.append(t0[accept])
+        fitted_segments.append(np.column_stack((x0, y0, x1, y1, x2, y2, x3, y3))[accept])
+
+        middle: np.ndarray = (t0[~accept] + t1[~accept]) / 2
+        t0, t1 = np.concatenate([t0[~accept], middle]), np.concatenate([middle, t1[~accept]])
+        if len(t0) == 0:
+            break
+
+    # Put the segments back in order along the curve
+    order: np.ndarray = np.argsort(np.concatenate(fitted_start) * np.sign(t_max - t_min), kind="stable")
+    return np.concatenate(fitted_segments)[order]
+
+
+def altitude_curve(alt: float, latitude: float) -> ParametricCurve:
+    """
+    The curve traced on the planisphere by a line of constant altitude, parameterised by azimuth in degrees.
+
+    :param alt:
+        The altitude of the line, degrees
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Parametric curve
+    """
+
+    def trace(az: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ra, dec = transform_array(alt=alt, az=az, latitude=latitude)
+        return pos_array(r=radius_array(dec=dec / unit_deg, latitude=latitude), t=ra)
+
+    return trace
+
+
+def azimuth_curve(az: float, latitude: float) -> ParametricCurve:
+    """
+    The curve traced on the planisphere by a line of constant azimuth, parameterised by altitude in degrees.
+
+    :param az:
+        The azimuth of the line, degrees
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Parametric curve
+    """
+
+    def trace(alt: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ra, dec = transform_array(alt=alt, az=az, latitude=latitude)
+        return pos_array(r=radius_array(dec=dec / unit_deg, latitude=latitude), t=ra)
+
+    return trace
+
+
+def bezier_extents(segments: np.ndarray) -> Dict[str, float]:
+    """
+    Find the exact extents of a sequence of cubic Bézier segments, including any bulges between their end points.
+
+    :param segments:
+        Array of segments, as returned by <fit_bezier_curve>
+    :return:
+        Dictionary with the elements 'x_min', 'x_max', 'y_min' and 'y_max' set, metres
+    """
+    extents: Dict[str, float] = {}
+
+    axis: str
+    offset: int
+    for axis, offset in (('x', 0), ('y', 1)):
+        p0, p1, p2, p3 = (segments[:, offset + 2 * i] for i in range(4))
+
+        # The coordinate is stationary where the derivative of the cubic, a quadratic a*u^2 + b*u + c, is zero
+        a: np.ndarray = p3 - 3 * p2 + 3 * p1 - p0
+        b: np.ndarray = 2 * (p2 - 2 * p1 + p0)
+        c: np.ndarray = p1 - p0
+        discriminant: np.ndarray = np.maximum(b ** 2 - 4 * a * c, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            roots: np.ndarray = np.stack([
+                np.where(a != 0, (-b + np.sqrt(discriminant)) / (2 * a), -c / b),
+                np.where(a != 0, (-b - np.sqrt(discriminant)) / (2 * a), -c / b)
+            ])
+
+        # Evaluate the curve at the stationary points which lie within each segment, and at its end points
+        u: np.ndarray = np.where(np.isfinite(roots) & (roots > 0) & (roots < 1), roots, 0)
+        values: np.ndarray = ((1 - u) ** 3 * p0 + 3 * (1 - u) ** 2 * u * p1 + 3 * (1 - u) * u ** 2 * p2 + u ** 3 * p3)
+        values = np.concatenate([values.ravel(), p0, p3])
+
+        extents[axis + '_min'] = float(values.min())
+        extents[axis + '_max'] = float(values.max())
+
+    return extents
@@ -0,0 +1,209 @@
+# disk_cache.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+Helper functions for storing data derived from the files in <raw_data> in a binary cache on disk, so that it does
+not need to be recomputed every time it is used. Cached files are named after a digest of the inputs they were
+computed from, so they are invalidated automatically whenever those inputs change.
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+# Directory where we store cached data
+cache_directory: str = "cache"
+
+# Digests of files we have already read, indexed by filename, and stored with the file's size and modification time
+file_digests: Dict[str, Tuple[Tuple[int, int], bytes]] = {}
+
+
+def file_digest(filename: str) -> bytes:
+    """
+    Compute a digest of the contents of a file. The result is remembered for as long as the file is not modified.
+
+    :param filename:
+        The filename of the file to hash
+    :return:
+        Binary digest
+    """
+    status: os.stat_result = os.stat(filename)
+    signature: Tuple[int, int] = (status.st_size, status.st_mtime_ns)
+
+    if filename in file_digests and file_digests[filename][0] == signature:
+        return file_digests[filename][1]
+
+    with open(filename, "rb") as f:
+        digest: bytes = hashlib.sha256(f.read()).digest()
+    file_digests[filename] = (signature, digest)
+    return digest
+
+
+def hash_inputs(files: Iterable[str] = (), values: Iterable[object] = ()) -> str:
+    """
+    Compute a digest of the contents of a list of files, together with a list of Python values.
+
+    :param files:
+        The filenames of the files to hash
+    :param values:
+        Python values to hash. These must be serialisable as JSON.
+    :return:
+        Hexadecimal digest string
+    """
+    digest = hashlib.sha256()
+
+    filename: str
+    for filename in files:
+        digest.update(file_digest(filename=filename))
+
+    value: object
+    for value in values:
+        digest.update(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def cache_filename(name: str, files: Iterable[str] = (), values: Iterable[object] = (), suffix: str = "npy") -> str:
+    """
+    Return the filename where data derived from a set of inputs is cached.
+
+    :param name:
+        A name describing the data being cached, e.g. <bright_star_catalog>
+    :param files:
+        The filenames of the files the data is derived from, including the code used to derive it
+    :param values:
+        Any other Python values the data depends upon
+    :param suffix:
+        The file type suffix for the cache file
+    :return:
+        Filename
+    """
+    return os.path.join(cache_directory, "{}_{}.{}".format(name, hash_inputs(files=files, values=values)[:16], suffix))
+
+
+def save_array(filename: str, array: np.ndarray) -> None:
+    """
+    Write an array to the binary cache. The file is written under a temporary name and then moved into place, so
+    that several processes may safely populate the cache at once. Out-of-date versions of the same data are deleted.
+
+    :param filename:
+        The filename returned by <cache_filename>
+    :param array:
+        The array to store
+    :return:
+        None
+    """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_filename: str = "{}.tmp{:d}".format(filename, os.getpid())
+    with open(tmp_filename, "wb") as f:
+        np.save(f, array, allow_pickle=False)
+    os.replace(tmp_filename, filename)
+
+    remove_stale_copies(filename=filename)
+
+
+def save_arrays(filename: str, arrays: Dict[str, np.ndarray]) -> None:
+    """
+    Write a collection of named arrays to the binary cache, as a single <.npz> file. The file is written under a
+    temporary name and then moved into place, so that several processes may safely populate the cache at once.
+    Out-of-date versions of the same data are deleted.
+
+    :param filename:
+        The filename returned by <cache_filename>, with the suffix <npz>
+    :param arrays:
+        The arrays to store, indexed by name
+    :return:
+        None
+    """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_filename: str = "{}.tmp{:d}".format(filename, os.getpid())
+    with open(tmp_filename, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_filename, filename)
+
+    remove_stale_copies(filename=filename)
+
+
+def remove_stale_copies(filename: str) -> None:
+    """
+    Remove stale copies of some cached data, computed from old versions of the inputs.
+
+    :param filename:
+        The filename returned by <cache_filename> for the current version of the data
+    :return:
+        None
+    """
+    prefix: str = filename.rsplit("_", 1)[0]
+    stale: str
+    for stale in glob.glob("{}_{}{}".format(prefix, "[0-9a-f]" * 16, os.path.splitext(filename)[1])):
+        if stale != filename:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def mark_as_used(filename: str) -> None:
+    """
+    Record that a cached file has just been used, so that it is among the last to be removed by
+    <remove_least_recently_used>.
+
+    :param filename:
+        The filename returned by <cache_filename>
+    :return:
+        None
+    """
+    try:
+        os.utime(filename)
+    except OSError:
+        pass
+
+
+def remove_least_recently_used(pattern: str, max_files: int) -> None:
+    """
+    Limit the number of files in the cache whose names match a pattern, e.g. the copies of some data computed for many
+    different parameter values, by removing those which were least recently written or used.
+
+    :param pattern:
+        Shell-style wildcard pattern matching the filenames within the cache directory, e.g. <projection_table_*.npz>
+    :param max_files:
+        The maximum number of matching files to keep
+    :return:
+        None
+    """
+    modification_times: Dict[str, float] = {}
+    filename: str
+    for filename in glob.glob(os.path.join(cache_directory, pattern)):
+        try:
+            modification_times[filename] = os.path.getmtime(filename)
+        except OSError:
+            pass
+
+    # Remove the oldest files in excess of the limit
+    excess: int = max(len(modification_times) - max_files, 0)
+    for filename in sorted(modification_times, key=modification_times.get)[:excess]:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
@@ -20,14 +20,29 @@
 A thin wrapper to produce vector graphics using cairo.
 """
 
+import inspect
 import logging
 
+from collections import OrderedDict
+from contextlib import contextmanager
+
 from math import pi, sin, cos
-from typing import Dict, List, Optional, Sequence, Union
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import cairocffi as cairo
 from constants import unit_deg, unit_mm, font_size_base, line_width_base, dots_per_inch
 
+# The dimensions of text strings which have already been measured, shared between all the drawing contexts in this
+# process. These are indexed by font, font size, page format and resolution, and the text string itself. The least
+# recently used measurements are discarded when there are more than <text_extents_cache_size>.
+text_extents_cache: "OrderedDict[tuple, Dict[str, float]]" = OrderedDict()
+text_extents_cache_size: int = 65536
+
+# Recorded layers of drawing which are shared between many drawings, indexed by a key describing their contents.
+# The least recently used layers are discarded when there are more than <layer_cache_size>.
+layer_cache: "OrderedDict[tuple, GraphicsRecording]" = OrderedDict()
+layer_cache_size: int = 64
+
 
 class GraphicsPage:
     """
@@ -40,7 +55,8 @@ class GraphicsPage:
                  output: str = "page",
                  width: float = 0.15,
                  height: float = 0.15,
-                 dots_per_inch: float = dots_per_inch):
+                 dots_per_inch: float = dots_per_inch,
+                 target: Optional[BinaryIO] = None):
         """
         A thin wrapper to produce vector graphics using cairo. This class represents a page / image file we are going
         to draw onto.
@@ -55,6 +71,9 @@ class GraphicsPage:
             The height of the page, metres
         :param dots_per_inch:
             The dots per inch resolution to render this page
+        :param target:
+            A writable binary file object to write the image to. If this is specified, the image is written to this
+            stream, rather than to the file named by <output>.
         """
 
         # PDF surfaces are always measured in points
@@ -62,59 +81,215 @@ class GraphicsPage:
             dots_per_inch = 72.
 
         self.format: str = img_format
-        self.output: str = "{}.{}".format(output, img_format)
+        self.output: Optional[str] = "{}.{}".format(output, img_format) if target is None else None
+        self.target: Union[str, BinaryIO] = self.output if target is None else target
         self.dots_per_metre: float = dots_per_inch * 39.370079
         self.width: int = int(width * self.dots_per_metre)  # pixels
         self.height: int = int(height * self.dots_per_metre)  # pixels
 
         self.surface: Optional[cairo.Surface] = None
         if self.format == "pdf":
-            self.surface = cairo.PDFSurface(self.output, self.width, self.height)
+            self.surface = cairo.PDFSurface(self.target, self.width, self.height)
         elif self.format == "png":
             self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width, self.height)
         elif self.format == "svg":
-            self.surface = cairo.SVGSurface(self.output, self.width, self.height)
+            self.surface = cairo.SVGSurface(self.target, self.width, self.height)
         else:
             assert False, "Unknown image output format {}".format(self.format)
 
-    def __del__(self) -> None:
+    def close(self) -> Optional[str]:
         """
-        Save the canvas we have drawn to disk
+        Save the canvas we have drawn to disk. When this method returns, the file is complete and has been closed.
+        If the page is being written to a stream, the image has been written to the stream in full, but the stream
+        itself is left open.
 
         :return:
-            None
+            The filename of the image file we produced, or None if it was written to a stream
         """
 
         # Protect against being called twice
         if self.surface is None:
-            return
+            return self.output
 
-        logging.info("Creating file <{}>".format(self.output))
+        if self.output is not None:
+            logging.info("Creating file <{}>".format(self.output))
 
         if self.format == "pdf":
             self.surface.show_page()
         elif self.format == "png":
-            self.surface.write_to_png(self.output)
+            self.surface.write_to_png(self.target)
         elif self.format == "svg":
             self.surface.show_page()
         else:
             assert False, "Unknown image output format {}".format(self.format)
 
-        # Clean up
+        # Clean up. Finishing the surface flushes any remaining output and closes the file.
         self.surface.finish()
         self.surface = None
+        return self.output
+
+    def new_page(self) -> None:
+        """
+        Finish the current page, and start a new blank page of the same size. Only PDF files may contain more than
+        one page.
+
+        :return:
+            None
+        """
+        assert self.format == "pdf", "Only PDF files can contain more than one page"
+        self.surface.show_page()
+
+    def __del__(self) -> None:
+        self.close()
 
     def __enter__(self):
         return self
 
     def __exit__(self, err_type, err_value, err_tb):
-        self.__del__()
+        self.close()
 
     @staticmethod
     def supported_formats() -> Sequence[str]:
         return "pdf", "png", "svg"
 
 
+class GraphicsRecording(GraphicsPage):
+    """
+    A page which records drawing operations in memory, rather than writing them to a file, so that they can be
+    replayed onto any number of other pages afterwards.
+    """
+
+    def __init__(self, bounding_box: Dict[str, float]):
+        """
+        A page which records drawing operations in memory, rather than writing them to a file, so that they can be
+        replayed onto any number of other pages afterwards.
+
+        :param bounding_box:
+            The area of the canvas to be recorded, metres, as returned by <BaseComponent.bounding_box>
+        """
+
+        # Record in points, like PDF and SVG pages, so that text is measured in the same way
+        self.format: str = "recording"
+        self.output: Optional[str] = None
+        self.bounding_box: Dict[str, float] = bounding_box
+        self.dots_per_metre: float = 72. * 39.370079
+        self.width: float = (bounding_box['x_max'] - bounding_box['x_min']) * self.dots_per_metre  # points
+        self.height: float = (bounding_box['y_max'] - bounding_box['y_min']) * self.dots_per_metre  # points
+
+        self.surface: Optional[cairo.Surface] = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA,
+                                                                       (0, 0, self.width, self.height))
+
+    def close(self) -> Optional[str]:
+        """
+        Discard the recorded drawing operations.
+
+        :return:
+            None, since recordings are not saved to disk
+        """
+
+        # Protect against being called twice
+        if self.surface is None:
+            return None
+
+        self.surface.finish()
+        self.surface = None
+        return None
+
+    def replay(self, page: GraphicsPage, offset_x: float = 0, offset_y: float = 0) -> None:
+        """
+        Replay the recorded drawing operations onto another page, scaling them to that page's resolution.
+
+        :param page:
+            The GraphicsPage we are going to draw onto
+        :param offset_x:
+            The position on the page of the left edge of the recording, metres
+        :param offset_y:
+            The position on the page of the top edge of the recording, metres
+        :return:
+            None
+        """
+        assert self.surface is not None, "Cannot replay a recording which has been discarded"
+
+        context: cairo.Context = cairo.Context(target=page.surface)
+        context.translate(tx=offset_x * page.dots_per_metre, ty=offset_y * page.dots_per_metre)
+        context.scale(sx=page.dots_per_metre / self.dots_per_metre, sy=page.dots_per_metre / self.dots_per_metre)
+        context.set_source_surface(self.surface, 0, 0)
+        context.paint()
+
+    def copy(self) -> "GraphicsRecording":
+        """
+        Make a copy of this recording, by replaying it into a new one. If this recording contains no nested
+        recordings (see <GraphicsContext.paint_layer>), the copy shares no cairo surfaces with it, and the two can be
+        replayed on different threads at the same time.
+
+        :return:
+            GraphicsRecording instance
+        """
+        duplicate: GraphicsRecording = GraphicsRecording(bounding_box=self.bounding_box)
+        self.replay(page=duplicate)
+
+        # Cairo shares a single snapshot of a surface between everything which paints it, until the surface is next
+        # flushed. Flushing it now means that the next copy takes a snapshot of its own.
+        self.surface.flush()
+        return duplicate
+
+
+class GraphicsTile(GraphicsPage):
+    """
+    A rectangular piece of a bitmap image, which is drawn in memory so that a large image can be produced a piece at
+    a time.
+    """
+
+    def __init__(self, width: int, height: int, dots_per_inch: float = dots_per_inch):
+        """
+        A rectangular piece of a bitmap image, which is drawn in memory so that a large image can be produced a piece
+        at a time.
+
+        :param width:
+            The width of the tile, pixels
+        :param height:
+            The height of the tile, pixels
+        :param dots_per_inch:
+            The dots per inch resolution of the image
+        """
+        self.format: str = "png"
+        self.output: Optional[str] = None
+        self.dots_per_metre: float = dots_per_inch * 39.370079
+        self.width: int = width  # pixels
+        self.height: int = height  # pixels
+
+        self.surface: Optional[cairo.Surface] = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.width, self.height)
+
+    def close(self) -> Optional[str]:
+        """
+        Discard the pixels of the tile.
+
+        :return:
+            None, since tiles are not saved to disk
+        """
+
+        # Protect against being called twice
+        if self.surface is None:
+            return None
+
+        self.surface.finish()
+        self.surface = None
+        return None
+
+    def pixels(self) -> Tuple[memoryview, int]:
+        """
+        Return the pixels of the tile, in cairo's native ARGB32 format: premultiplied alpha, with each pixel stored
+        as a 32-bit integer in the machine's native byte order.
+
+        :return:
+            The pixel data, and the number of bytes between the starts of consecutive rows
+        """
+        assert self.surface is not None, "Cannot read a tile which has been discarded"
+
+        self.surface.flush()
+        return self.surface.get_data(), self.surface.get_stride()
+
+
 class GraphicsContext:
     """
     A thin wrapper to produce vector graphics using cairo. This class provides a drawing context that we can use to
@@ -125,7 +300,9 @@ class GraphicsContext:
                  page: GraphicsPage,
                  offset_x: float = 0,
                  offset_y: float = 0,
-                 rotation: float = 0):
+                 rotation: float = 0,
+                 share_layers: bool = True,
+                 context: Optional[cairo.Context] = None):
         """
         A thin wrapper to produce vector graphics using cairo. This class provides a drawing context that we can use to
         draw a figure onto a page.
@@ -138,6 +315,13 @@ class GraphicsContext:
             The offset of this drawing from (0,0) on the page, metres
         :param rotation:
             The rotation of this drawing, radians
+        :param share_layers:
+            If True, layers painted with <paint_layer> are shared with every other drawing in this process. If False,
+            they are drawn directly onto the page, so that this drawing shares no cairo surfaces with other drawings.
+        :param context:
+            An existing cairo context on <page> to draw with, in the coordinate system it already has, rather than
+            creating a new one. The offset and rotation are ignored, and the context's drawing settings are reset to
+            their defaults.
         """
 
         assert isinstance(page, GraphicsPage)
@@ -149,12 +333,26 @@ class GraphicsContext:
         self.font_bold: bool = False
         self.font_italic: bool = False
         self.line_dotted: bool = False
+        self.font_family: str = "FreeSerif"
+        self.page: GraphicsPage = page
+        self.page_format: str = page.format
+        self.dots_per_metre: float = page.dots_per_metre
+        self.rotation: float = rotation
+        self.share_layers: bool = share_layers
+
+        # Primitives waiting to be drawn in batched mode, indexed by the style they are to be drawn in
+        self.batched_primitives: Dict[tuple, List[Tuple[float, float, float, float]]] = {}
 
         # Create Cairo context with default settings for requested canvas
-        self.context: cairo.Context = cairo.Context(target=page.surface)
-        self.context.scale(sx=page.dots_per_metre, sy=page.dots_per_metre)
-        self.context.translate(tx=offset_x, ty=offset_y)
-        self.context.rotate(radians=rotation * unit_deg)
+        if context is None:
+            self.context: cairo.Context = cairo.Context(target=page.surface)
+            self.context.scale(sx=page.dots_per_metre, sy=page.dots_per_metre)
+            self.context.translate(tx=offset_x, ty=offset_y)
+            self.context.rotate(radians=rotation * unit_deg)
+        else:
+            self.context = context
+            self.context.set_source_rgba(red=0, green=0, blue=0, alpha=1)
+            self.context.set_dash([])
         self.set_line_width(line_width=1)
         self.set_font_style()
         self.set_font_size(font_size=1)
@@ -225,6 +423,25 @@ class GraphicsContext:
         """
         self.context.curve_to(x1=x0, y1=y0, x2=x1, y2=y1, x3=x2, y3=y2)
 
+    def bezier_curve(self, segments: Sequence[Sequence[float]]) -> None:
+        """
+        Add a sequence of cubic Bézier segments to the current path, each of which begins where the previous one
+        ended. A new sub-path is started at the start of the first segment.
+
+        :param segments:
+            List of segments, each containing its start point, two control points and end point as
+            [x0, y0, x1, y1, x2, y2, x3, y3], metres
+        :return:
+            None
+        """
+        if not len(segments):
+            return
+        self.context.move_to(x=segments[0][0], y=segments[0][1])
+        segment: Sequence[float]
+        for segment in segments:
+            self.context.curve_to(x1=segment[2], y1=segment[3], x2=segment[4], y2=segment[5],
+                                  x3=segment[6], y3=segment[7])
+
     def close_path(self) -> None:
         """
         Close the current path.
@@ -252,6 +469,65 @@ class GraphicsContext:
             self.set_color(color=color)
         self.context.fill_preserve()
 
+    def paint_layer(self, key: tuple, bounding_box: Dict[str, float],
+                    renderer: Callable[["GraphicsContext"], None]) -> None:
+        """
+        Paint a layer of drawing which is shared between many drawings, such as a part of a component which is the
+        same in every language. The first time a layer is requested, it is drawn by <renderer> into an in-memory
+        recording; subsequent requests for a layer with the same key, anywhere in this process, replay the recording.
+        Contexts created with <share_layers> set to False always draw the layer afresh, directly onto their own page,
+        clipped to its bounding box as a recording would be.
+
+        The layer is drawn in a fresh drawing context, so it does not see any clipping path, colour or font settings
+        made in this context, and its own settings do not leak back.
+
+        :param key:
+            A tuple which uniquely describes the contents of the layer, e.g. the component's name, language and theme
+        :param bounding_box:
+            The area of the canvas the layer covers, metres
+        :param renderer:
+            A function which draws the layer onto the GraphicsContext it is passed
+        :return:
+            None
+        """
+
+        # Draw unshared layers with this context's own cairo context, so that no nested recording is created. Saving
+        # and restoring its state keeps any clipping path in place, and stops the layer's settings leaking back.
+        if not self.share_layers:
+            self.context.save()
+            self.context.new_path()
+            self.context.rectangle(x=bounding_box['x_min'], y=bounding_box['y_min'],
+                                   width=bounding_box['x_max'] - bounding_box['x_min'],
+                                   height=bounding_box['y_max'] - bounding_box['y_min'])
+            self.context.clip()
+            with GraphicsContext(page=self.page, context=self.context, share_layers=False) as layer_context:
+                renderer(layer_context)
+            self.context.restore()
+            return
+
+        recording: GraphicsRecording
+        if key in layer_cache:
+            layer_cache.move_to_end(key)
+            recording = layer_cache[key]
+        else:
+            recording = GraphicsRecording(bounding_box=bounding_box)
+            with GraphicsContext(page=recording, offset_x=-bounding_box['x_min'],
+                                 offset_y=-bounding_box['y_min']) as layer_context:
+                renderer(layer_context)
+
+            # Keep shared layers for reuse, discarding the least recently used
+            layer_cache[key] = recording
+            while len(layer_cache) > layer_cache_size:
+                layer_cache.popitem(last=False)[1].close()
+
+        # Paint the recording, scaled from points back into metres
+        self.context.save()
+        self.context.translate(tx=recording.bounding_box['x_min'], ty=recording.bounding_box['y_min'])
+        self.context.scale(sx=1 / recording.dots_per_metre, sy=1 / recording.dots_per_metre)
+        self.context.set_source_surface(recording.surface, 0, 0)
+        self.context.paint()
+        self.context.restore()
+
     def clip(self) -> None:
         """
         Use the current path as a clipping region.
@@ -303,6 +579,89 @@ class GraphicsContext:
         """
         self.context.rectangle(x=x0, y=y0, width=x1 - x0, height=y1 - y0)
 
+    @contextmanager
+    def batch(self) -> Iterator["GraphicsContext"]:
+        """
+        Context manager within which lines and filled circles may be added with <batch_line> and <batch_circle>.
+        Primitives which share the same style are drawn together as a single path when the block exits, which is
+        much faster than drawing each one separately, and produces much smaller PDF and SVG files.
+        """
+        try:
+            yield self
+        finally:
+            self.flush_batch()
+
+    def batch_line(self, x0: float, y0: float, x1: float, y1: float, color: Sequence[float],
+                   line_width: float = 1, dotted: bool = False) -> None:
+        """
+        Queue a straight line to be stroked when the current batch is flushed.
+
+        :param x0:
+            The horizontal position of the start of the line, metres
+        :param y0:
+            The vertical position of the start of the line, metres
+        :param x1:
+            The horizontal position of the end of the line, metres
+        :param y1:
+            The vertical position of the end of the line, metres
+        :param color:
+            List of four float values: Red/green/blue/alpha.
+        :param line_width:
+            Line width, relative to the base line-width defined in <constants.py>
+        :param dotted:
+            Boolean flag indicating whether the line should be dotted or continuous.
+        :return:
+            None
+        """
+        style: tuple = ("stroke", tuple(color), line_width, dotted)
+        self.batched_primitives.setdefault(style, []).append((x0, y0, x1, y1))
+
+    def batch_circle(self, centre_x: float, centre_y: float, radius: float, color: Sequence[float]) -> None:
+        """
+        Queue a filled circle to be drawn when the current batch is flushed.
+
+        :param centre_x:
+            The centre of the circle, metres
+        :param centre_y:
+            The centre of the circle, metres
+        :param radius:
+            The radius of the circle, metres
+        :param color:
+            List of four float values: Red/green/blue/alpha.
+        :return:
+            None
+        """
+        style: tuple = ("fill", tuple(color))
+        self.batched_primitives.setdefault(style, []).append((centre_x, centre_y, radius, 0))
+
+    def flush_batch(self) -> None:
+        """
+        Draw all the primitives queued by <batch_line> and <batch_circle>, as one path for each style. The styles
+        are drawn in the order in which they were first used.
+
+        :return:
+            None
+        """
+        style: tuple
+        primitives: List[Tuple[float, float, float, float]]
+        for style, primitives in self.batched_primitives.items():
+            self.begin_path()
+            if style[0] == "stroke":
+                # Each line is a separate sub-path, so dotted lines restart their dash pattern at the start of each
+                for x0, y0, x1, y1 in primitives:
+                    self.context.move_to(x=x0, y=y0)
+                    self.context.line_to(x=x1, y=y1)
+                self.stroke(color=style[1], line_width=style[2], dotted=style[3])
+            else:
+                # Overlapping circles must not cancel each other out, so fill with the non-zero winding rule
+                for centre_x, centre_y, radius, _ in primitives:
+                    self.begin_sub_path()
+                    self.circle(centre_x=centre_x, centre_y=centre_y, radius=radius)
+                self.context.set_fill_rule(fill_rule=cairo.FILL_RULE_WINDING)
+                self.fill(color=style[1])
+                self.context.set_fill_rule(fill_rule=cairo.FILL_RULE_EVEN_ODD)
+        self.batched_primitives = {}
+
     def set_color(self, color: Sequence[float]) -> None:
         """
         Set the colour used for both stroke and fill operations.
@@ -355,7 +714,7 @@ class GraphicsContext:
         if bold is not None:
             self.font_bold = bold
 
-        self.context.select_font_face(family="FreeSerif",
+        self.context.select_font_face(family=self.font_family,
                                       slant=cairo.FONT_SLANT_ITALIC if self.font_italic else cairo.FONT_SLANT_NORMAL,
                                       weight=cairo.FONT_WEIGHT_BOLD if self.font_bold else cairo.FONT_SLANT_NORMAL
                                       )
@@ -428,18 +787,34 @@ class GraphicsContext:
             Dictionary of size information about the text string
         """
 
-        # Measure text
-        (x, y, width, height, dx, dy) = self.context.text_extents(text=text)
+        # Strings are often measured repeatedly -- both within a single drawing, and in every planisphere we draw --
+        # so reuse previous measurements where possible. Extents are measured in user space, and font hinting may
+        # depend on the scale and orientation of the output, so the linear part of the current transformation matrix
+        # (xx, yx, xy, yy) forms part of the key. The extents do not depend on its translation.
+        key: tuple = (self.font_family, self.font_bold, self.font_italic, self.font_size * self.base_font_size,
+                      self.page_format, self.context.get_matrix().as_tuple()[:4], text)
+
+        if key in text_extents_cache:
+            text_extents_cache.move_to_end(key)
+        else:
+            # Measure text
+            (x, y, width, height, dx, dy) = self.context.text_extents(text=text)
+
+            text_extents_cache[key] = {
+                "x": x,
+                "y": y,
+                "width": width,
+                "height": height,
+                "dx": dx,
+                "dy": dy
+            }
+
+            # Discard the least recently used measurements
+            while len(text_extents_cache) > text_extents_cache_size:
+                text_extents_cache.popitem(last=False)
 
         # Return dimensions
-        return {
-            "x": x,
-            "y": y,
-            "width": width,
-            "height": height,
-            "dx": dx,
-            "dy": dy
-        }
+        return dict(text_extents_cache[key])
 
     def circular_text(self, text: str, centre_x: float, centre_y: float,
                       radius: float, azimuth: float, spacing: float, size: float) -> None:
@@ -491,7 +866,7 @@ class GraphicsContext:
 
     def text_wrapped(self, text: Union[str, Sequence], x: float, y: float, width: float,
                      justify: int = 0, line_spacing: float = 1.3,
-                     h_align: int = 0, v_align: int = 0, rotation: float = 0) -> None:
+                     h_align: int = 0, v_align: int = 0, rotation: float = 0) -> float:
         """
         Add a text string to the drawing canvas.
 
@@ -513,6 +888,8 @@ class GraphicsContext:
             The vertical alignment of the string: -1 top; 0 centred; 1 bottom
         :param rotation:
             The rotation angle of the text, radians
+        :return:
+            The total height of the lines of text, metres
         """
 
         if not isinstance(text, (list, tuple)):
@@ -561,6 +938,7 @@ class GraphicsContext:
             y_anchor += line_heights[line_number]
 
         self.context.restore()
+        return total_height
 
     def paint_png_image(self, png_filename: str, x_left: float, y_top: float,
                         target_width: float, target_height: float) -> bool:
@@ -648,7 +1026,8 @@ class BaseComponent:
             settings = {}
         self.settings: dict = settings
 
-    def render_to_page(self, page: GraphicsPage, offset_x: float = 0, offset_y: float = 0, rotation: float = 0) -> None:
+    def render_to_page(self, page: GraphicsPage, offset_x: float = 0, offset_y: float = 0, rotation: float = 0,
+                       share_layers: bool = True) -> None:
         """
         Render this component onto a Page object.
 
@@ -660,20 +1039,23 @@ class BaseComponent:
             The offset of this drawing from (0,0) on the page, metres
         :param rotation:
             The rotation of this drawing, float
+        :param share_layers:
+            If False, do not share any recorded layers with other drawings. See <GraphicsContext>.
         """
 
         # Make sure that the page we're going to draw onto is of the correct type
         assert isinstance(page, GraphicsPage)
 
         # Create a drawing context for drawing onto this page
-        with GraphicsContext(page=page, offset_x=offset_x, offset_y=offset_y, rotation=rotation) as context:
+        with GraphicsContext(page=page, offset_x=offset_x, offset_y=offset_y, rotation=rotation,
+                             share_layers=share_layers) as context:
             # Render this item
             self.do_rendering(settings=self.settings, context=context)
 
     def render_to_file(self, filename: Optional[str] = None, img_format: str = "png",
-                       dots_per_inch: float = dots_per_inch) -> None:
+                       dots_per_inch: float = dots_per_inch) -> str:
         """
-        Renders the component to an image file.
+        Renders the component to an image file. The file is complete and closed by the time this method returns.
 
         :param filename:
             The filename of the image file to create (without file type stub)
@@ -684,7 +1066,7 @@ class BaseComponent:
         :type dots_per_inch:
             float
         :return:
-            BaseComponent instance
+            The filename of the image file we produced
         """
 
         # Look up the bounding box of the item we're about to draw
@@ -705,12 +1087,19 @@ class BaseComponent:
                                 offset_x=-bounding_box['x_min'],
                                 offset_y=-bounding_box['y_min'])
 
-    def render_all_formats(self, filename: Optional[str] = None, dots_per_inch: float = dots_per_inch) -> None:
+            # Write the file to disk before returning
+            return page.close()
+
+    def render_to_stream(self, stream: BinaryIO, img_format: str = "png",
+                         dots_per_inch: float = dots_per_inch) -> None:
         """
-        Quick shortcut to render this component in all the standard image formats.
+        Renders the component as an image, which is written to a binary file object rather than to a named file.
+        The image has been written in full by the time this method returns, but the stream is left open.
 
-        :param filename:
-            The filename of the image file to create (without file type stub)
+        :param stream:
+            A writable binary file object to write the image to
+        :param img_format:
+            The format of the image to create
         :param dots_per_inch:
             The dots per inch resolution to render this page
         :type dots_per_inch:
@@ -719,12 +1108,82 @@ class BaseComponent:
             None
         """
 
-        # Produce each image format in turn
-        for img_format in GraphicsPage.supported_formats():
+        # Look up the bounding box of the item we're about to draw
+        bounding_box: Dict[str, float] = self.bounding_box(settings=self.settings)
+
+        # Create a graphics page large enough to hold this item
+        with GraphicsPage(img_format=img_format, target=stream,
+                          width=bounding_box['x_max'] - bounding_box['x_min'],
+                          height=bounding_box['y_max'] - bounding_box['y_min'],
+                          dots_per_inch=dots_per_inch
+                          ) as page:
             # Render the item
-            self.render_to_file(filename=filename,
-                                img_format=img_format,
-                                dots_per_inch=dots_per_inch)
+            self.render_to_page(page=page,
+                                offset_x=-bounding_box['x_min'],
+                                offset_y=-bounding_box['y_min'])
+
+            # Write the image to the stream before returning
+            page.close()
+
+    def render_to_recording(self, share_layers: bool = True) -> GraphicsRecording:
+        """
+        Renders the component into an in-memory recording, which can then be replayed onto any number of pages.
+
+        :param share_layers:
+            If False, the recording contains no nested recordings of shared layers, so that copies of it made with
+            <GraphicsRecording.copy> can safely be replayed on different threads. See <GraphicsContext>.
+        :return:
+            GraphicsRecording instance
+        """
+
+        # Look up the bounding box of the item we're about to draw
+        bounding_box: Dict[str, float] = self.bounding_box(settings=self.settings)
+
+        # Record the item
+        recording: GraphicsRecording = GraphicsRecording(bounding_box=bounding_box)
+        self.render_to_page(page=recording,
+                            offset_x=-bounding_box['x_min'],
+                            offset_y=-bounding_box['y_min'],
+                            share_layers=share_layers)
+        return recording
+
+    def render_all_formats(self, filename: Optional[str] = None,
+                           dots_per_inch: float = dots_per_inch) -> Dict[str, str]:
+        """
+        Quick shortcut to render this component in all the standard image formats. The component is only drawn
+        once, into a recording which is then replayed onto a page of each format.
+
+        :param filename:
+            The filename of the image file to create (without file type stub)
+        :param dots_per_inch:
+            The dots per inch resolution to render this page
+        :type dots_per_inch:
+            float
+        :return:
+            Dictionary of the filenames of the image files we produced, indexed by image format. All the files are
+            complete and closed by the time this method returns.
+        """
+
+        # If no filename is specified, then individual derived classes should specify a default
+        if filename is None:
+            filename = self.default_filename()
+
+        outputs: Dict[str, str] = {}
+        with self.render_to_recording() as recording:
+            bounding_box: Dict[str, float] = recording.bounding_box
+
+            # Produce each image format in turn
+            for img_format in GraphicsPage.supported_formats():
+                with GraphicsPage(img_format=img_format, output=filename,
+                                  width=bounding_box['x_max'] - bounding_box['x_min'],
+                                  height=bounding_box['y_max'] - bounding_box['y_min'],
+                                  dots_per_inch=dots_per_inch
+                                  ) as page:
+                    # Replay the recorded item, and write the file to disk
+                    recording.replay(page=page)
+                    outputs[img_format] = page.close()
+
+        return outputs
 
     def bounding_box(self, settings: dict) -> Dict[str, float]:
         """
@@ -738,6 +1197,31 @@ class BaseComponent:
         raise NotImplementedError("Derived classes of type <BaseComponent> must implement a method <bounding_box> "
                                   "which reports the area of canvas they require.")
 
+    def region_is_blank(self, settings: dict, region: Dict[str, float]) -> bool:
+        """
+        Report whether nothing at all is drawn within a rectangular area of the canvas, so that renderers which draw
+        this item a piece at a time may skip that area. Derived classes may override this; by default, no area is
+        assumed to be blank.
+
+        :param settings:
+            A dictionary of settings required by the renderer.
+        :param region:
+            Dictionary with the elements 'x_min', 'x_max', 'y_min' and 'y_max' set to the area of canvas, metres
+        :return:
+            Boolean flag indicating that the area is certainly blank
+        """
+        return False
+
+    def source_files(self) -> List[str]:
+        """
+        List the files which the output of this component depends upon, so that we can tell when it needs to be
+        rebuilt. Derived classes should extend this list with any data files they read.
+
+        :return:
+            List of filenames
+        """
+        return [inspect.getsourcefile(GraphicsContext), "constants.py", inspect.getsourcefile(type(self))]
+
     def default_filename(self) -> str:
         """
         This method is required to report a default filename to use for this item, without file type suffix.
@@ -776,6 +1260,9 @@ class CompositeComponent(BaseComponent):
     def default_filename(self) -> str:
         return "composite_page"
 
+    def source_files(self) -> List[str]:
+        return [filename for item in self.components for filename in item.source_files()]
+
     def bounding_box(self, settings: dict) -> Dict[str, float]:
         """
         Work out overall bounding box of all items when constituent components are overlaid.
@@ -21,6 +21,8 @@
 Render the holder for the planisphere.
 """
 
+import numpy as np
+
 from math import pi, sin, cos, atan2, asin, hypot
 from numpy import arange
 from typing import Dict, List, Tuple
@@ -28,6 +30,7 @@ from typing import Dict, List, Tuple
 from constants import radius, transform, pos
 from constants import unit_deg, unit_rev, unit_cm, unit_mm, r_1, r_2, fold_gap, central_hole_size, line_width_base
 from graphics_context import BaseComponent, GraphicsContext
+from projection_tables import altitude_line
 from settings import fetch_command_line_arguments
 from text import text
 
@@ -43,6 +46,12 @@ class Holder(BaseComponent):
         """
         return "holder"
 
+    def source_files(self) -> List[str]:
+        """
+        Return the files which the holder is drawn from.
+        """
+        return super().source_files() + ["curve_fitting.py", "projection_tables.py"]
+
     def bounding_box(self, settings: dict) -> Dict[str, float]:
         """
         Return the bounding box of the canvas area used by this component.
@@ -62,24 +71,21 @@ class Holder(BaseComponent):
             'y_max': h + 1.2 * unit_cm
         }
 
-    def do_rendering(self, settings: dict, context: GraphicsContext) -> None:
+    @staticmethod
+    def draw_outline(context: GraphicsContext, latitude: float, is_southern: bool) -> None:
         """
-        This method is required to actually render this item.
+        Draw the outline of the holder, and the viewing window, which do not depend on the language.
 
-        :param settings:
-            A dictionary of settings required by the renderer.
         :param context:
             A GraphicsContext object to use for drawing
+        :param latitude:
+            The absolute latitude of the planisphere, degrees
+        :param is_southern:
+            Boolean flag indicating whether the planisphere is for the southern hemisphere
         :return:
             None
         """
 
-        is_southern: bool = settings['latitude'] < 0
-        latitude: float = abs(settings['latitude'])
-        language: str = settings['language']
-
-        context.set_font_size(0.9)
-
         a: float = 6 * unit_cm
         h: float = r_1 + fold_gap
 
@@ -109,20 +115,93 @@ class Holder(BaseComponent):
 
         # Shade the viewing window which needs to be cut out
         x0: Tuple[float, float] = (0, h)
+        horizon: np.ndarray = altitude_line(alt=0, latitude=latitude) + np.tile([x0[0], -x0[1]], 4)
         context.begin_path()
-        i: int
-        az: float
-        for i, az in enumerate(arange(0, 360.5, 1)):
-            pp: Tuple[float, float] = transform(alt=0, az=az, latitude=latitude)
-            r: float = radius(dec=pp[1] / unit_deg, latitude=latitude)
-            p: Dict[str, float] = pos(r=r, t=pp[0])
-            if i == 0:
-                context.move_to(x0[0] + p['x'], -x0[1] + p['y'])
-            else:
-                context.line_to(x0[0] + p['x'], -x0[1] + p['y'])
+        context.bezier_curve(segments=horizon.tolist())
         context.stroke()
         context.fill(color=(0, 0, 0, 0.2))
 
+    @staticmethod
+    def draw_clock_face(context: GraphicsContext, is_southern: bool) -> None:
+        """
+        Draw the clock face around the viewing window, which lines up with the date scale on the star wheel, except
+        for the numbers of the hours, which depend on the language.
+
+        :param context:
+            A GraphicsContext object to use for drawing
+        :param is_southern:
+            Boolean flag indicating whether the planisphere is for the southern hemisphere
+        :return:
+            None
+        """
+
+        h: float = r_1 + fold_gap
+        context.set_color(color=(0, 0, 0, 1))
+
+        # Clock face, which lines up with the date scale on the star wheel
+        theta: float = unit_rev / 24 * 7  # 5pm -> 7am means we cover 7 hours on either side of midnight
+        dash: float = unit_rev / 24 / 4  # Draw fat dashes at 15 minute intervals
+
+        # Outer edge of dashed scale
+        r_3: float = r_2 - 2 * unit_mm
+
+        # Inner edge of dashed scale
+        r_4: float = r_2 - 3 * unit_mm
+
+        # Radius of dashes for marking hours
+        r_5: float = r_2 - 4 * unit_mm
+
+        # Inner and outer curves around dashed scale
+        context.begin_path()
+        context.arc(centre_x=0, centre_y=-h, radius=r_3, arc_from=-theta - pi / 2, arc_to=theta - pi / 2)
+        context.begin_sub_path()
+        context.arc(centre_x=0, centre_y=-h, radius=r_4, arc_from=-theta - pi / 2, arc_to=theta - pi / 2)
+        context.stroke()
+
+        # Draw a fat dashed line with one dash every 15 minutes
+        for i in arange(-theta, theta, 2 * dash):
+            context.begin_path()
+            context.arc(centre_x=0, centre_y=-h, radius=(r_3 + r_4) / 2, arc_from=i - pi / 2, arc_to=i + dash - pi / 2)
+            context.stroke(line_width=(r_3 - r_4) / line_width_base)
+
+        # Stroke a dash for each hour
+        for hr in arange(-7, 7.1, 1):
+            t: float = unit_rev / 24 * hr * (-1 if not is_southern else 1)
+            context.begin_path()
+            context.move_to(x=r_3 * sin(t), y=-h - r_3 * cos(t))
+            context.line_to(x=r_5 * sin(t), y=-h - r_5 * cos(t))
+            context.stroke(line_width=1)
+
+    def do_rendering(self, settings: dict, context: GraphicsContext) -> None:
+        """
+        This method is required to actually render this item.
+
+        :param settings:
+            A dictionary of settings required by the renderer.
+        :param context:
+            A GraphicsContext object to use for drawing
+        :return:
+            None
+        """
+
+        is_southern: bool = settings['latitude'] < 0
+        latitude: float = abs(settings['latitude'])
+        language: str = settings['language']
+
+        context.set_font_size(0.9)
+
+        h: float = r_1 + fold_gap
+        x0: Tuple[float, float] = (0, h)
+
+        # Draw the outline of the holder, which is the same in every language, so is only drawn once per latitude,
+        # and then reused for each translation. The artwork which does not depend on the language is split into
+        # layers, so that it is stacked with the text in the same order as it always has been.
+        context.paint_layer(key=("Holder", "outline", latitude, is_southern),
+                            bounding_box=self.bounding_box(settings=settings),
+                            renderer=lambda layer_context: self.draw_outline(context=layer_context,
+                                                                             latitude=latitude,
+                                                                             is_southern=is_southern))
+
         # Display instructions for cutting out the viewing window
         instructions: str = text[language]["cut_out_instructions"]
         context.set_color(color=(0, 0, 0, 1))
@@ -164,36 +243,16 @@ class Holder(BaseComponent):
 
         context.set_font_style(bold=False)
 
-        # Clock face, which lines up with the date scale on the star wheel
-        theta: float = unit_rev / 24 * 7  # 5pm -> 7am means we cover 7 hours on either side of midnight
-        dash: float = unit_rev / 24 / 4  # Draw fat dashes at 15 minute intervals
-
-        # Outer edge of dashed scale
-        r_3: float = r_2 - 2 * unit_mm
-
-        # Inner edge of dashed scale
-        r_4: float = r_2 - 3 * unit_mm
-
-        # Radius of dashes for marking hours
-        r_5: float = r_2 - 4 * unit_mm
+        # Draw the clock face, which is the same at every latitude and in every language
+        context.paint_layer(key=("Holder", "clock_face", is_southern),
+                            bounding_box=self.bounding_box(settings=settings),
+                            renderer=lambda layer_context: self.draw_clock_face(context=layer_context,
+                                                                                is_southern=is_southern))
 
         # Radius of text marking hours
         r_6: float = r_2 - 5.5 * unit_mm
 
-        # Inner and outer curves around dashed scale
-        context.begin_path()
-        context.arc(centre_x=0, centre_y=-h, radius=r_3, arc_from=-theta - pi / 2, arc_to=theta - pi / 2)
-        context.begin_sub_path()
-        context.arc(centre_x=0, centre_y=-h, radius=r_4, arc_from=-theta - pi / 2, arc_to=theta - pi / 2)
-        context.stroke()
-
-        # Draw a fat dashed line with one dash every 15 minutes
-        for i in arange(-theta, theta, 2 * dash):
-            context.begin_path()
-            context.arc(centre_x=0, centre_y=-h, radius=(r_3 + r_4) / 2, arc_from=i - pi / 2, arc_to=i + dash - pi / 2)
-            context.stroke(line_width=(r_3 - r_4) / line_width_base)
-
-        # Write the hours
+        # Write the number of each hour
         for hr in arange(-7, 7.1, 1):
             txt: str = "{:.0f}{}".format(hr if (hr > 0) else hr + 12,
                                          "AM" if (hr > 0) else "PM")
@@ -202,15 +261,10 @@ class Holder(BaseComponent):
             if hr == 0:
                 txt = ""
             t: float = unit_rev / 24 * hr * (-1 if not is_southern else 1)
-
-            # Stroke a dash and write the number of the hour
-            context.begin_path()
-            context.move_to(x=r_3 * sin(t), y=-h - r_3 * cos(t))
-            context.line_to(x=r_5 * sin(t), y=-h - r_5 * cos(t))
-            context.stroke(line_width=1)
             context.text(text=txt, x=r_6 * sin(t), y=-h - r_6 * cos(t), h_align=0, v_align=0, gap=0, rotation=t)
 
         # Back edge
+        a: float = 6 * unit_cm
         b: float = unit_cm
         t1: float = atan2(h - a, r_1)
         t2: float = asin(b / hypot(r_1, h - a))
@@ -221,7 +275,7 @@ class Holder(BaseComponent):
         context.line_to(x=b * sin(t1 + t2), y=h + b * cos(t1 + t2))
         context.arc(centre_x=0, centre_y=h, radius=b, arc_from=unit_rev / 2 - (t1 + t2) - pi / 2,
                     arc_to=unit_rev / 2 + (t1 + t2) - pi / 2)
-        context.stroke(line_width=1)
+        context.stroke(line_width=1, color=(0, 0, 0, 1), dotted=False)
 
         # For latitudes not too close to the pole, we have enough space to fit instructions onto the planisphere
         if latitude < 56:
@@ -0,0 +1,337 @@
+# latex_document.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+Use LaTeX to assemble the parts of a planisphere into a single PDF document, with instructions for putting them
+together.
+
+Each document is built in its own scratch directory, so that several documents can be assembled at once without
+clobbering each other's files. pdflatex is run as an asyncio subprocess, so that documents can compile in the
+background while the planisphere parts for the next documents are being drawn.
+"""
+
+import asyncio
+import glob
+import os
+import re
+import shutil
+import signal
+import tempfile
+
+from typing import Dict, List, Optional, Tuple
+
+from disk_cache import cache_directory
+
+# The directory in which private working directories for LaTeX are created
+scratch_directory: str = os.path.join(cache_directory, "latex_scratch")
+
+# The maximum number of times pdflatex is run over each document
+max_passes: int = 3
+
+# Files which LaTeX writes during one pass, and reads back during the next, to resolve cross-references
+auxiliary_suffixes: Tuple[str, ...] = ("aux", "out", "toc", "lof", "lot")
+
+# Messages in the LaTeX log which indicate that another pass is needed
+rerun_request = re.compile(r"Rerun to get|Please rerun LaTeX|Rerun LaTeX|Label\(s\) may have changed")
+
+
+class LatexError(Exception):
+    """
+    Exception raised when pdflatex fails, or takes too long, to build a document.
+    """
+    pass
+
+
+def make_scratch_directory(source: str, parts: Dict[str, str], latitude_label: str,
+                           scratch_root: str = scratch_directory) -> str:
+    """
+    Create a private working directory for LaTeX, containing a copy of the document source, and the PDF files of
+    the parts of the planisphere that it includes. The name of the directory contains the ID of this process, so
+    that it can be removed by <remove_stale_scratch_directories> if this process dies without removing it.
+
+    :param source:
+        The filename of the LaTeX source of the document, e.g. <doc/planisphere.tex>
+    :param parts:
+        Dictionary of the PDF files to include, indexed by the name the LaTeX source uses for them, e.g. <starwheel>
+    :param latitude_label:
+        The LaTeX code to substitute for the latitude of the planisphere
+    :param scratch_root:
+        The directory in which to create the working directory
+    :return:
+        The path of the working directory
+    """
+
+    os.makedirs(scratch_root, exist_ok=True)
+    scratch: str = tempfile.mkdtemp(prefix="latex_{:d}_".format(os.getpid()), dir=scratch_root)
+
+    # The LaTeX source includes the parts from the subdirectory <tmp>
+    os.mkdir(os.path.join(scratch, "tmp"))
+    shutil.copy(source, scratch)
+
+    name: str
+    filename: str
+    for name, filename in parts.items():
+        shutil.copy(filename, os.path.join(scratch, "tmp", "{}.pdf".format(name)))
+
+    with open(os.path.join(scratch, "tmp", "lat.tex"), "wt") as f:
+        f.write(latitude_label)
+
+    return scratch
+
+
+def remove_stale_scratch_directories(scratch_root: str = scratch_directory) -> None:
+    """
+    Remove the working directories left behind by LaTeX builds in processes which were killed before they could
+    clean up after themselves.
+
+    :param scratch_root:
+        The directory in which the working directories are created
+    :return:
+        None
+    """
+    scratch: str
+    for scratch in glob.glob(os.path.join(scratch_root, "latex_*_*")):
+        try:
+            pid: int = int(os.path.basename(scratch).split("_")[1])
+        except ValueError:
+            continue
+
+        # Leave the directories of processes which are still running
+        try:
+            os.kill(pid, 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue
+
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+async def run_pdflatex(scratch: str, tex_filename: str, timeout: Optional[float] = None) -> str:
+    """
+    Run a single pass of pdflatex over a document, capturing everything it prints.
+
+    :param scratch:
+        The working directory containing the document
+    :param tex_filename:
+        The filename of the LaTeX source of the document, within the working directory
+    :param timeout:
+        The maximum time to wait for pdflatex to finish, seconds. If None, wait indefinitely.
+    :return:
+        The text which pdflatex wrote to stdout and stderr
+    """
+
+    process: asyncio.subprocess.Process = await asyncio.create_subprocess_exec(
+        "pdflatex", "-interaction=nonstopmode", tex_filename,
+        cwd=scratch, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True
+    )
+
+    # Collect the output as it is written, so that whatever pdflatex has printed is still available if it hangs
+    stdout: List[bytes] = []
+
+    async def collect_output() -> None:
+        while True:
+            chunk: bytes = await process.stdout.read(65536)
+            if not chunk:
+                break
+            stdout.append(chunk)
+
+    try:
+        await asyncio.wait_for(asyncio.gather(collect_output(), process.wait()), timeout=timeout)
+    except asyncio.TimeoutError:
+        # Make sure a hung pdflatex, and any programs it has started, do not outlive the build
+        os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+
+        # Pass on everything pdflatex printed before it was killed, so that it can be saved to the log
+        stdout.append(await process.stdout.read())
+        raise LatexError("pdflatex timed out after {:.0f} seconds".format(timeout),
+                         b"".join(stdout).decode("utf-8", errors="replace"))
+
+    console_output: str = b"".join(stdout).decode("utf-8", errors="replace")
+    if process.returncode != 0:
+        raise LatexError("pdflatex exited with status {:d}".format(process.returncode), console_output)
+    return console_output
+
+
+def read_auxiliary_files(directory: str, job_name: str) -> Dict[str, bytes]:
+    """
+    Read the auxiliary files which LaTeX uses to carry cross-references from one pass to the next.
+
+    :param directory:
+        The directory containing the files
+    :param job_name:
+        The filename of the document, without file type suffix
+    :return:
+        Dictionary of the contents of the files which exist, indexed by file type suffix
+    """
+    contents: Dict[str, bytes] = {}
+    suffix: str
+    for suffix in auxiliary_suffixes:
+        filename: str = os.path.join(directory, "{}.{}".format(job_name, suffix))
+        if os.path.exists(filename):
+            with open(filename, "rb") as f:
+                contents[suffix] = f.read()
+    return contents
+
+
+def rerun_requested(directory: str, job_name: str) -> bool:
+    """
+    Check whether the log of the last pass of LaTeX asks for another pass.
+
+    :param directory:
+        The directory containing the log file
+    :param job_name:
+        The filename of the document, without file type suffix
+    :return:
+        Boolean flag indicating whether LaTeX needs to be run again
+    """
+    log_filename: str = os.path.join(directory, "{}.log".format(job_name))
+    if not os.path.exists(log_filename):
+        return False
+    with open(log_filename, "rt", errors="replace") as f:
+        return rerun_request.search(f.read()) is not None
+
+
+def auxiliary_cache_directory(output: str) -> str:
+    """
+    The directory where the auxiliary files from the last successful build of a document are kept, so that the next
+    build can start from where that one finished.
+
+    :param output:
+        The filename of the PDF document
+    :return:
+        Directory path
+    """
+    return os.path.join(cache_directory, "latex", os.path.splitext(os.path.basename(output))[0])
+
+
+async def build_latex_document(source: str, parts: Dict[str, str], latitude_label: str, output: str,
+                               timeout: Optional[float] = None) -> None:
+    """
+    Compile a LaTeX document in a private working directory, and move the resulting PDF file to its final
+    destination. If pdflatex fails, its console output is saved alongside the output, with the suffix <.log>.
+
+    pdflatex is only run again while its auxiliary files are still changing, or its log asks for another pass, up
+    to a maximum of <max_passes>. The auxiliary files of the previous build of the same document are used as a
+    starting point, so a document whose cross-references have not changed usually only needs a single pass.
+
+    :param source:
+        The filename of the LaTeX source of the document, e.g. <doc/planisphere.tex>
+    :param parts:
+        Dictionary of the PDF files to include, indexed by the name the LaTeX source uses for them, e.g. <starwheel>
+    :param latitude_label:
+        The LaTeX code to substitute for the latitude of the planisphere
+    :param output:
+        The filename of the PDF document to produce
+    :param timeout:
+        The maximum time to allow each pass of pdflatex, seconds. If None, wait indefinitely.
+    :return:
+        None
+    """
+
+    scratch: str = make_scratch_directory(source=source, parts=parts, latitude_label=latitude_label)
+    log_filename: str = "{}.log".format(os.path.splitext(output)[0])
+    try:
+        tex_filename: str = os.path.basename(source)
+        job_name: str = os.path.splitext(tex_filename)[0]
+
+        # Start from the auxiliary files of the previous build of this document, if there was one
+        aux_cache: str = auxiliary_cache_directory(output=output)
+        suffix: str
+        for suffix in read_auxiliary_files(directory=aux_cache, job_name=job_name):
+            shutil.copy(os.path.join(aux_cache, "{}.{}".format(job_name, suffix)), scratch)
+
+        # Build LaTeX documentation, until the cross-references stop changing
+        for build_pass in range(max_passes):
+            auxiliary_before: Dict[str, bytes] = read_auxiliary_files(directory=scratch, job_name=job_name)
+            try:
+                await run_pdflatex(scratch=scratch, tex_filename=tex_filename, timeout=timeout)
+            except LatexError as error:
+                with open(log_filename, "wt") as f:
+                    f.write(error.args[1] if len(error.args) > 1 else "")
+                raise LatexError("{} while building <{}>; see <{}>".format(error.args[0], output, log_filename))
+
+            if (read_auxiliary_files(directory=scratch, job_name=job_name) == auxiliary_before and
+                    not rerun_requested(directory=scratch, job_name=job_name)):
+                break
+
+        # Move the finished document into place in a single step, so that it never appears half-written. It is
+        # copied next to its destination first, since the working directory may be on a different filesystem.
+        shutil.copyfile(os.path.join(scratch, "{}.pdf".format(job_name)), "{}.tmp{:d}".format(output, os.getpid()))
+        os.replace("{}.tmp{:d}".format(output, os.getpid()), output)
+
+        # Keep the auxiliary files for the next time this document is built
+        os.makedirs(aux_cache, exist_ok=True)
+        contents: bytes
+        for suffix, contents in read_auxiliary_files(directory=scratch, job_name=job_name).items():
+            aux_filename: str = os.path.join(aux_cache, "{}.{}".format(job_name, suffix))
+            with open("{}.tmp{:d}".format(aux_filename, os.getpid()), "wb") as f:
+                f.write(contents)
+            os.replace("{}.tmp{:d}".format(aux_filename, os.getpid()), aux_filename)
+
+        # Remove the log of any previous failed attempt to build this document
+        if os.path.exists(log_filename):
+            os.remove(log_filename)
+    finally:
+        # Clean up the rubbish that LaTeX leaves behind
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+class LatexQueue:
+    """
+    A queue of LaTeX documents waiting to be built, which limits how many copies of pdflatex run at once.
+    """
+
+    def __init__(self, max_jobs: int = 1, timeout: Optional[float] = None):
+        """
+        A queue of LaTeX documents waiting to be built, which limits how many copies of pdflatex run at once.
+
+        :param max_jobs:
+            The maximum number of documents to build at once
+        :param timeout:
+            The maximum time to allow each pass of pdflatex, seconds. If None, wait indefinitely.
+        """
+        self.max_jobs: int = max_jobs
+        self.timeout: Optional[float] = timeout
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(max_jobs)
+
+        # Clear up after any previous builds which were killed part way through
+        remove_stale_scratch_directories()
+
+    async def build(self, source: str, parts: Dict[str, str], latitude_label: str, output: str) -> None:
+        """
+        Build a LaTeX document, once one of the slots in the queue becomes free. See <build_latex_document>.
+
+        :param source:
+            The filename of the LaTeX source of the document, e.g. <doc/planisphere.tex>
+        :param parts:
+            Dictionary of the PDF files to include, indexed by the name the LaTeX source uses for them
+        :param latitude_label:
+            The LaTeX code to substitute for the latitude of the planisphere
+        :param output:
+            The filename of the PDF document to produce
+        :return:
+            None
+        """
+        async with self.semaphore:
+            await build_latex_document(source=source, parts=parts, latitude_label=latitude_label, output=output,
+                                       timeout=self.timeout)
@@ -17,13 +17,11 @@
 
 # ----------------------------------------------------------------------------
 
-# Delete any previous output from running this script
-rm -Rf __pycache__ *.pyc output
-rm -Rf doc/*.aux doc/*.dvi doc/*.log doc/*.pdf doc/*.ps doc/tmp doc/*.out
+# Delete any compiled python files. Previous output is kept, and only the files whose inputs have changed are rebuilt.
+rm -Rf __pycache__ *.pyc
 
 # Run the python 3 script which generates planisphere models for a wide range of latitudes
 python3 planisphere.py $@
 
 # Clean up temporary files which get made along the way
 rm -Rf __pycache__ *.pyc
-rm -Rf doc/*.aux doc/*.dvi doc/*.log doc/*.pdf doc/*.ps doc/tmp doc/*.out
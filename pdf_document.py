@@ -0,0 +1,170 @@
+# pdf_document.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+Assemble the parts of a planisphere into a single multi-page PDF document directly with cairo, without using LaTeX.
+This is much faster than building the document with LaTeX, but the instructions are less elaborate: they are
+taken from the strings in <text.py> which are also printed on the holder.
+"""
+
+import os
+
+from typing import Dict, Sequence
+
+from constants import unit_cm
+from graphics_context import BaseComponent, GraphicsContext, GraphicsPage
+from settings import fetch_command_line_arguments
+from text import text
+
+# The size of the pages of the document (A4)
+page_width: float = 21.0 * unit_cm
+page_height: float = 29.7 * unit_cm
+
+
+class InstructionsPage(BaseComponent):
+    """
+    Render a page of instructions for using a planisphere, to go at the front of the document.
+    """
+
+    def default_filename(self) -> str:
+        """
+        Return the default filename to use when saving this component.
+        """
+        return "instructions"
+
+    def bounding_box(self, settings: dict) -> Dict[str, float]:
+        """
+        Return the bounding box of the canvas area used by this component.
+
+        :param settings:
+            A dictionary of settings required by the renderer.
+        :return:
+            Dictionary with the elements 'x_min', 'x_max', 'y_min' and 'y_max' set
+        """
+        return {
+            'x_min': 0,
+            'x_max': page_width,
+            'y_min': 0,
+            'y_max': page_height
+        }
+
+    def do_rendering(self, settings: dict, context: GraphicsContext) -> None:
+        """
+        This method is required to actually render this item.
+
+        :param settings:
+            A dictionary of settings required by the renderer.
+        :param context:
+            A GraphicsContext object to use for drawing
+        :return:
+            None
+        """
+
+        is_southern: bool = settings['latitude'] < 0
+        latitude: float = abs(settings['latitude'])
+        language: str = settings['language']
+
+        margin: float = 2 * unit_cm
+        width: float = page_width - 2 * margin
+        y: float = 3 * unit_cm
+
+        # Big bold title
+        context.set_font_size(3.0)
+        context.set_font_style(bold=True)
+        context.text(text="{} {:.0f}\u00B0{}".format(text[language]['title'], latitude,
+                                                     "N" if not is_southern else "S"),
+                     x=page_width / 2, y=y, h_align=0, v_align=0, gap=0, rotation=0)
+        context.set_font_style(bold=False)
+        y += 2 * unit_cm
+
+        # Numbered instructions, one after another
+        instructions: Sequence[str] = (
+            text[language]['instructions_1'],
+            text[language]['instructions_2'].format(cardinal="north" if not is_southern else "south"),
+            text[language]['instructions_3']
+        )
+        step: int
+        for step, instruction in enumerate(instructions):
+            context.set_font_size(2)
+            context.text(text="{:d}".format(step + 1), x=margin, y=y, h_align=-1, v_align=0, gap=0, rotation=0)
+            y += 0.8 * unit_cm
+            context.set_font_size(1.2)
+            y += context.text_wrapped(text=instruction, x=margin, y=y, width=width, justify=-1,
+                                      h_align=-1, v_align=1, rotation=0)
+            y += 0.8 * unit_cm
+
+        # Explanatory text about planispheres
+        context.set_font_size(1.2)
+        context.text_wrapped(text=text[language]['instructions_4'], x=margin, y=y, width=width, justify=-1,
+                             h_align=-1, v_align=1, rotation=0)
+
+        # Display web link and copyright text at the foot of the page
+        context.set_font_size(0.9)
+        context.text(text=text[language]['more_info'], x=page_width / 2, y=page_height - margin,
+                     h_align=0, v_align=0, gap=0, rotation=0)
+
+
+def build_pdf_document(pages: Sequence[BaseComponent], output: str) -> None:
+    """
+    Render a list of components into a single PDF document, with each component centred on its own A4 page.
+
+    :param pages:
+        The components to render, in page order
+    :param output:
+        The filename of the PDF document to produce
+    :return:
+        None
+    """
+
+    # Write the document under a temporary name, and then move it into place in a single step, so that it never
+    # appears half-written
+    output_stem: str = "{}.tmp{:d}".format(os.path.splitext(output)[0], os.getpid())
+
+    with GraphicsPage(img_format="pdf", output=output_stem, width=page_width, height=page_height) as document:
+        page_number: int
+        component: BaseComponent
+        for page_number, component in enumerate(pages):
+            if page_number > 0:
+                document.new_page()
+
+            bounding_box: Dict[str, float] = component.bounding_box(settings=component.settings)
+            component.render_to_page(
+                page=document,
+                offset_x=(page_width - bounding_box['x_max'] - bounding_box['x_min']) / 2,
+                offset_y=(page_height - bounding_box['y_max'] - bounding_box['y_min']) / 2
+            )
+
+        temporary_filename: str = document.close()
+
+    os.replace(temporary_filename, output)
+
+
+# Do it right away if we're run as a script
+if __name__ == "__main__":
+    # Fetch command line arguments passed to us
+    arguments = fetch_command_line_arguments(default_filename=InstructionsPage().default_filename())
+
+    # Render the instructions page
+    InstructionsPage(settings={
+        'latitude': arguments['latitude'],
+        'language': 'en',
+        'theme': arguments['theme'],
+    }).render_to_file(
+        filename=arguments['filename'],
+        img_format=arguments['img_format']
+    )
@@ -25,93 +25,460 @@ Additionally, we use LaTeX to build a summary document for each latitude, which
 to build a planisphere for that latitude, and instructions as to how to put them together.
 """
 
+import asyncio
 import os
-import subprocess
-import time
+import sys
 
-from typing import Dict, Union
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 
 import text
 from alt_az import AltAzGrid
+from build_manifest import BuildManifest, component_digest
+from disk_cache import hash_inputs
+from graphics_context import BaseComponent, GraphicsPage
 from holder import Holder
-from settings import fetch_command_line_arguments
+from latex_document import LatexError, LatexQueue
+from pdf_document import InstructionsPage, build_pdf_document
+from settings import command_line_parser
 from starwheel import StarWheel
 
-# Create output directory
-os.system("rm -Rf output")
-os.system("mkdir -p output/planispheres output/planisphere_parts")
 
-arguments: Dict[str, Union[int, str]] = fetch_command_line_arguments()
-theme: str = arguments['theme']
+def fetch_planisphere_arguments() -> Dict[str, Union[int, float, str]]:
+    """
+    Read input parameters from the command line, including the options which only apply to building the full set
+    of planispheres.
 
-# Render planisphere in all available languages
-language: str
-for language in text.text:
+    :return:
+        Dictionary of command-line arguments
+    """
+
+    parser = command_line_parser()
+    parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                        help="The number of worker processes to use to render planispheres in parallel. "
+                             "Zero means use one worker per CPU core.")
+    parser.add_argument('--latex-jobs', dest='latex_jobs', type=int, default=1,
+                        help="The number of LaTeX documents to compile at once, while further planispheres are "
+                             "being rendered. Zero means one per CPU core.")
+    parser.add_argument('--latex-timeout', dest='latex_timeout', type=float, default=300,
+                        help="The maximum time, in seconds, to allow each pass of pdflatex before giving up.")
+    parser.add_argument('--assembly', dest='assembly', choices=("latex", "native"), default="latex",
+                        help="How to assemble the parts of each planisphere into a document. <latex> produces "
+                             "polished documents with full instructions; <native> writes the PDF directly with "
+                             "cairo, which is much faster and does not need LaTeX.")
+    args = parser.parse_args()
+
+    return {
+        "theme": args.theme,
+        "jobs": args.jobs if args.jobs > 0 else (os.cpu_count() or 1),
+        "latex_jobs": args.latex_jobs if args.latex_jobs > 0 else (os.cpu_count() or 1),
+        "latex_timeout": args.latex_timeout,
+        "assembly": args.assembly
+    }
+
+
+def planisphere_jobs() -> List[Tuple[str, int]]:
+    """
+    List all the (language, latitude) pairs we make planispheres for, in the order in which they are reported. All
+    the languages for each latitude are listed together, since they share much of their artwork.
+
+    :return:
+        List of (language, latitude) tuples
+    """
+
+    jobs: List[Tuple[str, int]] = []
 
     # Render climates for latitudes at 5-degree spacings from 10 deg -- 85 deg, plus 52N
-    latitude: float
+    latitude: int
     for latitude in list(range(-80, 90, 5)) + [52]:
 
         # Do not make equatorial planispheres, as they don't really work
         if -10 < latitude < 10:
             continue
 
-        # Boolean flag for which hemisphere we're in
-        southern: bool = latitude < 0
-
-        # A dictionary of common substitutions
-        subs: Dict[str, Union[str, float]] = {
-            "dir_parts": "output/planisphere_parts",
-            "dir_out": "output/planispheres",
-            "abs_lat": abs(latitude),
-            "ns": "S" if southern else "N",
-            "lang": language,
-            "lang_short": "" if language == "en" else "_{}".format(language)
-        }
-
-        settings: Dict[str, Union[str, float]] = {
-            'language': language,
-            'latitude': latitude,
-            'theme': theme
-        }
-
-        # Render the various parts of the planisphere
-        StarWheel(settings=settings).render_all_formats(
-            filename="{dir_parts}/starwheel_{abs_lat:02d}{ns}_{lang}".format(**subs)
-        )
-
-        Holder(settings=settings).render_all_formats(
-            filename="{dir_parts}/holder_{abs_lat:02d}{ns}_{lang}".format(**subs)
-        )
-
-        AltAzGrid(settings=settings).render_all_formats(
-            filename="{dir_parts}/alt_az_grid_{abs_lat:02d}{ns}_{lang}".format(**subs)
-        )
-
-        # Copy the PDF versions of the components of this astrolabe into LaTeX's working directory, to produce a
-        # PDF file containing all the parts of this astrolabe
-        os.system("mkdir -p doc/tmp")
-        os.system("cp {dir_parts}/starwheel_{abs_lat:02d}{ns}_{lang}.pdf doc/tmp/starwheel.pdf".format(**subs))
-        os.system("cp {dir_parts}/holder_{abs_lat:02d}{ns}_{lang}.pdf doc/tmp/holder.pdf".format(**subs))
-        os.system("cp {dir_parts}/alt_az_grid_{abs_lat:02d}{ns}_{lang}.pdf doc/tmp/altaz.pdf".format(**subs))
-
-        with open("doc/tmp/lat.tex", "wt") as f:
-            f.write(r"${abs_lat:d}^\circ${ns}".format(**subs))
-
-        # Wait for cairo to wake up and close the files
-        time.sleep(1)
-
-        # Build LaTeX documentation
-        for build_pass in range(3):
-            subprocess.check_output("cd doc ; pdflatex planisphere{lang_short}.tex".format(**subs), shell=True)
-
-        os.system("mv doc/planisphere{lang_short}.pdf "
-                  "{dir_out}/planisphere_{abs_lat:02d}{ns}_{lang}.pdf".format(**subs))
-
-        # For the English language planisphere, create a symlink with no language suffix in the filename
-        if language == "en":
-            os.system("ln -s planisphere_{abs_lat:02d}{ns}_en.pdf "
-                      "{dir_out}/planisphere_{abs_lat:02d}{ns}.pdf".format(**subs))
-
-        # Clean up the rubbish that LaTeX leaves behind
-        os.system("cd doc ; rm -f *.aux *.log *.dvi *.ps *.pdf")
+        # Render planisphere in all available languages
+        language: str
+        for language in text.text:
+            jobs.append((language, latitude))
+
+    return jobs
+
+
+def substitutions(language: str, latitude: int) -> Dict[str, Union[str, float]]:
+    """
+    A dictionary of common substitutions used to build the filenames of the outputs for a single planisphere.
+
+    :param language:
+        The language of the planisphere
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Dictionary of substitutions
+    """
+
+    # Boolean flag for which hemisphere we're in
+    southern: bool = latitude < 0
+
+    return {
+        "dir_parts": "output/planisphere_parts",
+        "dir_out": "output/planispheres",
+        "abs_lat": abs(latitude),
+        "ns": "S" if southern else "N",
+        "lang": language,
+        "lang_short": "" if language == "en" else "_{}".format(language)
+    }
+
+
+def document_filename(language: str, latitude: int) -> str:
+    """
+    The filename of the PDF document containing all the parts of the planisphere for a single language and latitude.
+
+    :param language:
+        The language of the planisphere
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Filename
+    """
+    return "{dir_out}/planisphere_{abs_lat:02d}{ns}_{lang}.pdf".format(**substitutions(language=language,
+                                                                                      latitude=latitude))
+
+
+# The manifest of the previous build, as seen by this process
+previous_build: Dict[str, str] = {}
+
+
+def initialise_worker(manifest_entries: Dict[str, str]) -> None:
+    """
+    Give a worker process a copy of the manifest of the previous build, so that it can tell which of its outputs
+    are already up to date.
+
+    :param manifest_entries:
+        The entries of the manifest of the previous build
+    :return:
+        None
+    """
+    global previous_build
+    previous_build = manifest_entries
+
+
+def planisphere_components(language: str, latitude: int, theme: str) -> Dict[str, Tuple[BaseComponent, str]]:
+    """
+    The components which make up the planisphere for a single language and latitude.
+
+    :param language:
+        The language of the planisphere
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :param theme:
+        The color theme of the planisphere
+    :return:
+        Dictionary of (component, filename without file type suffix) tuples, indexed by the name LaTeX uses for the
+        part, in the order in which they appear in the document
+    """
+
+    subs: Dict[str, Union[str, float]] = substitutions(language=language, latitude=latitude)
+
+    settings: Dict[str, Union[str, float]] = {
+        'language': language,
+        'latitude': latitude,
+        'theme': theme
+    }
+
+    return {
+        "starwheel": (StarWheel(settings=settings), "{dir_parts}/starwheel_{abs_lat:02d}{ns}_{lang}".format(**subs)),
+        "holder": (Holder(settings=settings), "{dir_parts}/holder_{abs_lat:02d}{ns}_{lang}".format(**subs)),
+        "altaz": (AltAzGrid(settings=settings), "{dir_parts}/alt_az_grid_{abs_lat:02d}{ns}_{lang}".format(**subs))
+    }
+
+
+def render_parts(language: str, latitude: int,
+                 theme: str) -> Tuple[Dict[str, Dict[str, str]], Dict[str, str]]:
+    """
+    Render the various parts of the planisphere for a single language and latitude, in all image formats. Parts
+    whose files are already up to date are not rendered again.
+
+    :param language:
+        The language of the planisphere
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :param theme:
+        The color theme of the planisphere
+    :return:
+        Dictionary of the finished files for each part, indexed by the name LaTeX uses for the part, and then by
+        image format; and a dictionary of the digest of the inputs to each part
+    """
+
+    components: Dict[str, Tuple[BaseComponent, str]] = planisphere_components(language=language, latitude=latitude,
+                                                                             theme=theme)
+
+    parts: Dict[str, Dict[str, str]] = {}
+    digests: Dict[str, str] = {}
+    name: str
+    component: BaseComponent
+    filename: str
+    for name, (component, filename) in components.items():
+        digests[name] = component_digest(component=component)
+        parts[name] = {img_format: "{}.{}".format(filename, img_format)
+                       for img_format in GraphicsPage.supported_formats()}
+
+        # Only render this part if its inputs have changed since the previous build
+        if not BuildManifest.is_current(entries=previous_build, outputs=list(parts[name].values()),
+                                        digest=digests[name]):
+            parts[name] = component.render_all_formats(filename=filename)
+
+    return parts, digests
+
+
+# The outputs of rendering the parts of a single planisphere: manifest entries for the parts, the filenames of the
+# parts as returned by <render_parts>, and the digest of the inputs to the document which assembles them
+RenderedPlanisphere = Tuple[Dict[str, str], Dict[str, Dict[str, str]], str]
+
+
+async def build_document(language: str, latitude: int, parts: Dict[str, Dict[str, str]],
+                         latex_queue: LatexQueue) -> None:
+    """
+    Use LaTeX to build a PDF document containing all the parts of the planisphere for a single language and
+    latitude, together with instructions for assembling them.
+
+    :param language:
+        The language of the planisphere
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :param parts:
+        The finished files for each part, as returned by <render_parts>
+    :param latex_queue:
+        The queue of LaTeX documents to build the document in
+    :return:
+        None
+    """
+
+    subs: Dict[str, Union[str, float]] = substitutions(language=language, latitude=latitude)
+
+    # LaTeX runs in a private working directory, so documents for different planispheres can be built concurrently
+    await latex_queue.build(
+        source="doc/planisphere{lang_short}.tex".format(**subs),
+        parts={name: outputs["pdf"] for name, outputs in parts.items()},
+        latitude_label=r"${abs_lat:d}^\circ${ns}".format(**subs),
+        output=document_filename(language=language, latitude=latitude)
+    )
+
+    link_english_document(language=language, latitude=latitude)
+
+
+def link_english_document(language: str, latitude: int) -> None:
+    """
+    For the English language planisphere, create a symlink to the document with no language suffix in the filename.
+
+    :param language:
+        The language of the planisphere
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        None
+    """
+
+    if language != "en":
+        return
+
+    subs: Dict[str, Union[str, float]] = substitutions(language=language, latitude=latitude)
+    link: str = "{dir_out}/planisphere_{abs_lat:02d}{ns}.pdf".format(**subs)
+    link_tmp: str = "{}.tmp{:d}".format(link, os.getpid())
+    os.symlink("planisphere_{abs_lat:02d}{ns}_en.pdf".format(**subs), link_tmp)
+    os.replace(link_tmp, link)
+
+
+def render_planisphere(language: str, latitude: int, theme: str, assembly: str = "latex") -> RenderedPlanisphere:
+    """
+    Render all the parts of the planisphere for a single language and latitude, skipping any which are already up
+    to date. This is the unit of work which is farmed out to worker processes.
+
+    If the document is assembled natively, it is built here too, so that it can reuse the artwork drawn for the
+    parts. Otherwise it is built afterwards by LaTeX, using <build_document>.
+
+    :param language:
+        The language of the planisphere
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :param theme:
+        The color theme of the planisphere
+    :param assembly:
+        How the document is assembled: either <latex> or <native>
+    :return:
+        Manifest entries for the parts (and for the document, if it was assembled natively), the filenames of the
+        parts, and the digest of the inputs to the document
+    """
+
+    parts: Dict[str, Dict[str, str]]
+    digests: Dict[str, str]
+    parts, digests = render_parts(language=language, latitude=latitude, theme=theme)
+
+    entries: Dict[str, str] = {output: digests[name] for name, outputs in parts.items() for output in outputs.values()}
+
+    if assembly == "native":
+        # The document depends on the code which lays it out, as well as on all of the parts
+        document: str = document_filename(language=language, latitude=latitude)
+        document_digest: str = hash_inputs(files=["pdf_document.py"], values=[assembly, digests])
+
+        if not BuildManifest.is_current(entries=previous_build, outputs=[document], digest=document_digest):
+            components: List[BaseComponent] = [
+                component for component, filename in planisphere_components(language=language, latitude=latitude,
+                                                                             theme=theme).values()
+            ]
+            instructions: InstructionsPage = InstructionsPage(settings=components[0].settings)
+            build_pdf_document(pages=[instructions] + components, output=document)
+            link_english_document(language=language, latitude=latitude)
+
+        entries[document] = document_digest
+    else:
+        # The document depends on its LaTeX source, as well as on all of the parts
+        lang_short: str = substitutions(language=language, latitude=latitude)['lang_short']
+        document_digest = hash_inputs(files=["doc/planisphere{}.tex".format(lang_short), "latex_document.py"],
+                                      values=[digests])
+
+    return entries, parts, document_digest
+
+
+def render_planisphere_group(jobs: List[Tuple[str, int]], theme: str,
+                             assembly: str) -> List[Tuple[Optional[RenderedPlanisphere], Optional[BaseException]]]:
+    """
+    Render a group of planispheres for the same latitude, one after another in the same process, so that the parts
+    of the artwork which are the same in every language are only drawn once.
+
+    :param jobs:
+        List of (language, latitude) tuples, all for the same latitude
+    :param theme:
+        The color theme of the planispheres
+    :param assembly:
+        How the documents are assembled: either <latex> or <native>
+    :return:
+        List of (rendered planisphere, exception) tuples, one for each job, where the exception is None if the
+        parts were rendered successfully
+    """
+
+    outcomes: List[Tuple[Optional[RenderedPlanisphere], Optional[BaseException]]] = []
+    for language, latitude in jobs:
+        try:
+            outcomes.append((render_planisphere(language=language, latitude=latitude, theme=theme,
+                                                assembly=assembly), None))
+        except Exception as error:
+            outcomes.append((None, error))
+    return outcomes
+
+
+async def run_build(jobs: List[Tuple[str, int]], theme: str, workers: int, latex_jobs: int,
+                    latex_timeout: Optional[float], manifest: BuildManifest, assembly: str = "latex") -> List[str]:
+    """
+    Build every planisphere in a list of jobs. The parts are rendered by a pool of worker processes -- or by a
+    background thread, if there is only one worker -- while the documents for the planispheres which are already
+    rendered are compiled by LaTeX. Jobs for the same latitude are always rendered by the same process, so that they
+    can share artwork. The manifest is saved as each output is completed, so that an interrupted build can be resumed.
+
+    :param jobs:
+        List of (language, latitude) tuples
+    :param theme:
+        The color theme of the planispheres
+    :param workers:
+        The number of worker processes to use to render the parts of the planispheres
+    :param latex_jobs:
+        The number of LaTeX documents to compile at once
+    :param latex_timeout:
+        The maximum time to allow each pass of pdflatex, seconds
+    :param manifest:
+        The manifest of the previous build, which is updated as outputs are built
+    :param assembly:
+        How the documents are assembled: either <latex>, or <native>, in which case they are built by the workers
+    :return:
+        List of descriptions of the jobs which failed, in the order the jobs were supplied
+    """
+
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    latex_queue: LatexQueue = LatexQueue(max_jobs=latex_jobs, timeout=latex_timeout)
+
+    # Group the jobs by latitude
+    groups: Dict[int, List[Tuple[str, int]]] = {}
+    for job in jobs:
+        groups.setdefault(job[1], []).append(job)
+
+    errors: Dict[Tuple[str, int], BaseException] = {}
+    documents: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    async def build_and_record(job: Tuple[str, int], parts: Dict[str, Dict[str, str]], digest: str) -> None:
+        await build_document(language=job[0], latitude=job[1], parts=parts, latex_queue=latex_queue)
+        manifest.update(entries={document_filename(language=job[0], latitude=job[1]): digest})
+        manifest.save()
+
+    executor: Executor
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=initialise_worker,
+                                       initargs=(dict(manifest.entries),))
+    else:
+        executor = ThreadPoolExecutor(max_workers=1, initializer=initialise_worker,
+                                      initargs=(dict(manifest.entries),))
+
+    with executor:
+        renders: List[asyncio.Future] = [loop.run_in_executor(executor, render_planisphere_group, group, theme, assembly)
+                                         for group in groups.values()]
+
+        # As each latitude is rendered, queue its documents for LaTeX
+        for group, render in zip(groups.values(), renders):
+            outcomes: List[Tuple[Optional[RenderedPlanisphere], Optional[BaseException]]]
+            try:
+                outcomes = await render
+            except Exception as group_error:
+                outcomes = [(None, group_error)] * len(group)
+
+            for job, (rendered, error) in zip(group, outcomes):
+                if error is not None:
+                    errors[job] = error
+                    continue
+
+                part_entries: Dict[str, str]
+                parts: Dict[str, Dict[str, str]]
+                document_digest: str
+                part_entries, parts, document_digest = rendered
+                manifest.update(entries=part_entries)
+
+                if not BuildManifest.is_current(entries=manifest.entries,
+                                                outputs=[document_filename(language=job[0], latitude=job[1])],
+                                                digest=document_digest):
+                    documents[job] = asyncio.create_task(build_and_record(job=job, parts=parts,
+                                                                          digest=document_digest))
+            manifest.save()
+
+    # Wait for LaTeX to finish
+    for job, document in documents.items():
+        try:
+            await document
+        except Exception as error:
+            errors[job] = error
+
+    # LaTeX errors already describe which document failed, and where to find its log
+    failures: List[str] = []
+    for job in jobs:
+        if job in errors:
+            description: str = str(errors[job]) if isinstance(errors[job], LatexError) else repr(errors[job])
+            failures.append("{} {:d}: {}".format(job[0], job[1], description))
+    return failures
+
+
+# Do it right away if we're run as a script
+if __name__ == "__main__":
+    arguments: Dict[str, Union[int, float, str]] = fetch_planisphere_arguments()
+
+    # Create output directory. Outputs from previous builds are kept, and only rebuilt if their inputs have changed.
+    os.system("mkdir -p output/planispheres output/planisphere_parts")
+    build_manifest: BuildManifest = BuildManifest()
+
+    # Build each planisphere, collecting any failures in a deterministic order
+    failures: List[str] = asyncio.run(run_build(jobs=planisphere_jobs(), theme=arguments['theme'],
+                                                workers=arguments['jobs'], latex_jobs=arguments['latex_jobs'],
+                                                latex_timeout=arguments['latex_timeout'],
+                                                manifest=build_manifest, assembly=arguments['assembly']))
+
+    # Report a single summary of everything that went wrong
+    if failures:
+        sys.stderr.write("{:d} planisphere(s) failed to build:\n".format(len(failures)))
+        for failure in failures:
+            sys.stderr.write("  {}\n".format(failure))
+        sys.exit(1)
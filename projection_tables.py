@@ -0,0 +1,264 @@
+# projection_tables.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+Lines of constant altitude and azimuth, projected onto the planisphere and fitted with Bézier curves. These depend
+only on the latitude, so each is computed once, and then shared between all the components which draw it -- the
+alt-az grid and the holder both draw the horizon -- and between their bounding boxes and their drawings, in every
+language, theme and image format.
+
+The lines which the planisphere uses are stored in a table on disk for each latitude, so that new processes can load
+them rather than computing them again. The tables are invalidated automatically whenever the projection changes, and
+the tables for the least recently used latitudes are deleted when there are more than <projection_table_max_files>.
+"""
+
+import os
+import zipfile
+
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import numpy as np
+
+from curve_fitting import fit_bezier_curve, bezier_extents, altitude_curve, azimuth_curve, default_tolerance
+from curve_fitting import CurveFittingError
+from disk_cache import cache_filename, save_arrays, mark_as_used, remove_least_recently_used
+
+# The files which define the projection, and how lines are fitted
+projection_sources: Tuple[str, ...] = ("constants.py", "curve_fitting.py", __file__)
+
+# The lines of constant altitude drawn on the alt-az grid at every latitude: the horizon, and the lines of the grid
+grid_altitudes: Tuple[float, ...] = (0, 10, 20, 30, 40, 50, 60, 70, 80)
+
+# The lines of constant azimuth stored in the table for each latitude: S, SSE, SE, ESE, E, etc
+table_azimuths: Tuple[float, ...] = tuple(22.5 * i for i in range(16))
+
+# The maximum number of tables to keep on disk, one for each latitude. The least recently used are deleted first.
+projection_table_max_files: int = 128
+
+# Tables of lines which have already been projected, indexed by latitude. Each contains lines indexed by the kind of
+# line and its altitude or azimuth. The least recently used tables are discarded when there are more than
+# <projection_table_cache_size>.
+projection_tables: "OrderedDict[float, Dict[Tuple[str, float], np.ndarray]]" = OrderedDict()
+projection_table_cache_size: int = 32
+
+# The extents of lines of constant altitude which have already been measured, indexed by altitude and latitude. The
+# least recently used are discarded when there are more than <altitude_line_extents_cache_size>.
+altitude_line_extents: "OrderedDict[Tuple[float, float], Dict[str, float]]" = OrderedDict()
+altitude_line_extents_cache_size: int = 256
+
+
+def window_edge_altitude(latitude: float) -> float:
+    """
+    Return the altitude of the line around the outer edge of the alt-az grid, which includes a margin for gluing
+    instructions.
+
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Altitude, degrees
+    """
+
+    # At latitudes very close to the equator, the point -12 degrees below the horizon is below dec -90!
+    if abs(latitude) < 15:
+        return -8
+
+    return -10
+
+
+def bounding_box_altitude(latitude: float) -> float:
+    """
+    Return the altitude of the line which encloses everything drawn on the alt-az grid, and so defines its bounding
+    box.
+
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Altitude, degrees
+    """
+
+    # At latitudes very close to the equator, the point -12 degrees below the horizon is below dec -90!
+    if abs(latitude) < 15:
+        return -9
+
+    return -12
+
+
+def table_altitudes(latitude: float) -> Tuple[float, ...]:
+    """
+    Return the altitudes of the lines of constant altitude which the planisphere uses at a particular latitude, and
+    which are stored in its table. Lines further below the horizon may pass through the celestial pole, and cannot be
+    fitted.
+
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Tuple of altitudes, degrees
+    """
+    return (bounding_box_altitude(latitude=latitude), window_edge_altitude(latitude=latitude)) + grid_altitudes
+
+
+def altitude_line(alt: float, latitude: float) -> np.ndarray:
+    """
+    Return a line of constant altitude, all the way around the sky, projected onto the planisphere.
+
+    :param alt:
+        The altitude of the line, degrees
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Read-only array of Bézier segments, as returned by <fit_bezier_curve>
+    """
+    table: Dict[Tuple[str, float], np.ndarray] = fetch_projection_table(latitude=latitude)
+    key: Tuple[str, float] = ("altitude", float(alt))
+
+    if key not in table:
+        segments: np.ndarray = fit_bezier_curve(curve=altitude_curve(alt=alt, latitude=latitude), t_min=0, t_max=360)
+        segments.flags.writeable = False
+        table[key] = segments
+
+    return table[key]
+
+
+def altitude_line_bounding_box(alt: float, latitude: float) -> Dict[str, float]:
+    """
+    Return the extents of a line of constant altitude, all the way around the sky, projected onto the planisphere.
+
+    :param alt:
+        The altitude of the line, degrees
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Dictionary with the elements 'x_min', 'x_max', 'y_min' and 'y_max' set, metres
+    """
+    key: Tuple[float, float] = (float(alt), float(latitude))
+
+    if key in altitude_line_extents:
+        altitude_line_extents.move_to_end(key)
+    else:
+        altitude_line_extents[key] = bezier_extents(segments=altitude_line(alt=alt, latitude=latitude))
+
+        # Discard the least recently used extents
+        while len(altitude_line_extents) > altitude_line_extents_cache_size:
+            altitude_line_extents.popitem(last=False)
+
+    return dict(altitude_line_extents[key])
+
+
+def azimuth_line(az: float, latitude: float) -> np.ndarray:
+    """
+    Return a line of constant azimuth, from the horizon to the zenith, projected onto the planisphere.
+
+    :param az:
+        The azimuth of the line, degrees
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Read-only array of Bézier segments, as returned by <fit_bezier_curve>
+    """
+    table: Dict[Tuple[str, float], np.ndarray] = fetch_projection_table(latitude=latitude)
+    key: Tuple[str, float] = ("azimuth", float(az))
+
+    if key not in table:
+        segments: np.ndarray = fit_bezier_curve(curve=azimuth_curve(az=az, latitude=latitude), t_min=0, t_max=90)
+        segments.flags.writeable = False
+        table[key] = segments
+
+    return table[key]
+
+
+def fetch_projection_table(latitude: float) -> Dict[Tuple[str, float], np.ndarray]:
+    """
+    Return the table of projected lines for a particular latitude, loading it if it is not already in memory.
+
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Dictionary of arrays of Bézier segments, indexed by the kind of line, and its altitude or azimuth
+    """
+    latitude = float(latitude)
+
+    if latitude in projection_tables:
+        projection_tables.move_to_end(latitude)
+    else:
+        projection_tables[latitude] = load_projection_table(latitude=latitude)
+
+        # Discard the least recently used tables
+        while len(projection_tables) > projection_table_cache_size:
+            projection_tables.popitem(last=False)
+
+    return projection_tables[latitude]
+
+
+def load_projection_table(latitude: float) -> Dict[Tuple[str, float], np.ndarray]:
+    """
+    Load the table of projected lines for a particular latitude from disk, computing it and saving it first if it
+    does not already exist.
+
+    :param latitude:
+        The latitude of the planisphere, degrees
+    :return:
+        Dictionary of arrays of Bézier segments, indexed by the kind of line, and its altitude or azimuth
+    """
+    filename: str = cache_filename(name="projection_table_{}".format(latitude), files=projection_sources,
+                                   values=[latitude, default_tolerance], suffix="npz")
+
+    # Read the table, if it has already been computed
+    arrays: Dict[str, np.ndarray] = {}
+    if os.path.exists(filename):
+        try:
+            with np.load(filename, allow_pickle=False) as table:
+                arrays = {name: table[name] for name in table.files}
+            mark_as_used(filename=filename)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            arrays = {}
+
+    # Otherwise compute all the lines in the table, and save it for next time. Lines which cannot be fitted to within
+    # tolerance are left out, so that only good fits are saved; if they are ever drawn, fitting them again raises the
+    # error.
+    if not arrays:
+        alt: float
+        for alt in table_altitudes(latitude=latitude):
+            try:
+                arrays["altitude_{}".format(float(alt))] = fit_bezier_curve(
+                    curve=altitude_curve(alt=alt, latitude=latitude), t_min=0, t_max=360)
+            except CurveFittingError:
+                continue
+
+        az: float
+        for az in table_azimuths:
+            try:
+                arrays["azimuth_{}".format(float(az))] = fit_bezier_curve(
+                    curve=azimuth_curve(az=az, latitude=latitude), t_min=0, t_max=90)
+            except CurveFittingError:
+                continue
+
+        # Save the table, and delete the tables for the least recently used latitudes
+        save_arrays(filename=filename, arrays=arrays)
+        remove_least_recently_used(pattern="projection_table_*.npz", max_files=projection_table_max_files)
+
+    # Index the lines by their kind, and their altitude or azimuth
+    table: Dict[Tuple[str, float], np.ndarray] = {}
+    name: str
+    segments: np.ndarray
+    for name, segments in arrays.items():
+        kind, value = name.split("_")
+        segments.flags.writeable = False
+        table[(kind, float(value))] = segments
+
+    return table
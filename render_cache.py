@@ -0,0 +1,214 @@
+# render_cache.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+A cache on disk of rendered images of the components of the planisphere, so that the same component is not rendered
+again every time it is requested. Images are stored under a digest of the component's settings, together with the
+source code and data files it is drawn from, so that they are invalidated automatically whenever any of these change.
+
+The cache is bounded in size: when it grows too large, the least recently used images are deleted. Images are written
+under a temporary name and then moved into place, so that several processes may safely share the same cache.
+
+The source code and data files of each type of component are only hashed once, when the cache is created or when that
+type of component is first rendered, since they are not expected to change while a long-running process is using the
+cache.
+"""
+
+import os
+
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+from build_manifest import component_settings
+from disk_cache import cache_directory, hash_inputs
+from graphics_context import BaseComponent
+
+
+def normalise_settings(settings: dict) -> dict:
+    """
+    Convert a dictionary of settings into a canonical form, so that equivalent settings -- for example a latitude of
+    52 and a latitude of 52.0 -- produce the same cache key.
+
+    :param settings:
+        The settings of a component
+    :return:
+        Dictionary of settings, with whole-number floats converted to integers
+    """
+    output: dict = {}
+    for key, value in settings.items():
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        output[key] = value
+    return output
+
+
+class RenderCache:
+    """
+    A size-bounded cache on disk of rendered images, with least recently used images discarded first.
+    """
+
+    def __init__(self, directory: str = os.path.join(cache_directory, "renders"), max_bytes: int = 256 * 1024 ** 2,
+                 component_types: Iterable[Type[BaseComponent]] = ()):
+        """
+        A size-bounded cache on disk of rendered images, with least recently used images discarded first.
+
+        :param directory:
+            The directory in which to store the cached images
+        :param max_bytes:
+            The maximum total size of the cached images, bytes
+        :param component_types:
+            The types of component which will be rendered, whose source files are hashed straight away
+        """
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+
+        # Digests of the source code and data files of each type of component, indexed by type
+        self.source_digests: Dict[Type[BaseComponent], str] = {}
+
+        component_type: Type[BaseComponent]
+        for component_type in component_types:
+            self.source_digest(component=component_type())
+
+    def source_digest(self, component: BaseComponent) -> str:
+        """
+        Return a digest of the source code and data files of a type of component, hashing them the first time that
+        type is seen.
+
+        :param component:
+            A component of the type required
+        :return:
+            Hexadecimal digest string
+        """
+        component_type: Type[BaseComponent] = type(component)
+        if component_type not in self.source_digests:
+            self.source_digests[component_type] = hash_inputs(files=component.source_files())
+        return self.source_digests[component_type]
+
+    def key(self, component: BaseComponent, img_format: str, dots_per_inch: float) -> str:
+        """
+        Compute the key under which an image of a component is stored. This covers the component's settings, its
+        source code and data files, and the format and resolution of the image.
+
+        :param component:
+            The component to be rendered
+        :param img_format:
+            The format of the image
+        :param dots_per_inch:
+            The resolution of the image
+        :return:
+            Hexadecimal digest string
+        """
+        return hash_inputs(values=[self.source_digest(component=component), component_settings(component=component),
+                                   img_format, float(dots_per_inch)])
+
+    def filename(self, key: str, img_format: str) -> str:
+        """
+        The filename where the image with a particular key is stored.
+
+        :param key:
+            The key returned by <RenderCache.key>
+        :param img_format:
+            The format of the image
+        :return:
+            Filename
+        """
+        return os.path.join(self.directory, "{}.{}".format(key, img_format))
+
+    def lookup(self, key: str, img_format: str) -> Optional[str]:
+        """
+        Look up an image in the cache, and mark it as recently used.
+
+        :param key:
+            The key returned by <RenderCache.key>
+        :param img_format:
+            The format of the image
+        :return:
+            The filename of the image, or None if it is not in the cache
+        """
+        filename: str = self.filename(key=key, img_format=img_format)
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            # Another process may have evicted the image at any point
+            return None
+        return filename
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Delete the least recently used images until the cache is within its size limit.
+
+        :param keep:
+            The filename of an image which should not be deleted, even if it is larger than the cache, e.g. because it
+            has only just been stored
+        :return:
+            None
+        """
+
+        # List the images in the cache, with the time they were last used. Temporary files belong to writes which are
+        # still in progress.
+        entries: List[Tuple[int, int, str]] = []
+        total_size: int = 0
+        entry: os.DirEntry
+        for entry in os.scandir(self.directory):
+            if ".tmp" in entry.name:
+                continue
+            try:
+                status: os.stat_result = entry.stat()
+            except FileNotFoundError:
+                continue
+            total_size += status.st_size
+            if entry.path != keep:
+                entries.append((status.st_mtime_ns, status.st_size, entry.path))
+
+        # Delete the oldest images first
+        entries.sort()
+        for mtime, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def render(self, component: BaseComponent, img_format: str, dots_per_inch: float) -> str:
+        """
+        Render a component to an image file in the cache, unless there is already a cached copy. The image is
+        written straight to disk, without being held in memory.
+
+        :param component:
+            The component to be rendered
+        :param img_format:
+            The format of the image
+        :param dots_per_inch:
+            The resolution of the image
+        :return:
+            The filename of the image
+        """
+        key: str = self.key(component=component, img_format=img_format, dots_per_inch=dots_per_inch)
+
+        filename: Optional[str] = self.lookup(key=key, img_format=img_format)
+        if filename is None:
+            filename = self.filename(key=key, img_format=img_format)
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_filename: str = "{}.tmp{:d}".format(filename, os.getpid())
+            with open(tmp_filename, "wb") as f:
+                component.render_to_stream(stream=f, img_format=img_format, dots_per_inch=dots_per_inch)
+            os.replace(tmp_filename, filename)
+
+            self.evict(keep=filename)
+        return filename
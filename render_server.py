@@ -0,0 +1,517 @@
+#!/usr/bin/python3
+# render_server.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+A small HTTP server which renders the components of the planisphere on demand, for any whole number of degrees of
+latitude, and any language and theme.
+
+Components are requested with URLs such as </starwheel.png?latitude=52&language=en&theme=default&dpi=200>. The
+components available are <starwheel>, <holder> and <altaz>, in any of the image formats <pdf>, <png> and <svg>.
+
+Rendering is done by a pool of worker processes which are started when the server starts, and which keep the star
+catalogue, stick figures, fonts and recorded artwork in memory between requests. Rendered images are kept in a cache
+on disk, so repeated requests for the same image are answered without rendering it again. Workers write images
+straight into the cache, and the server streams them from there to the client, so no image is ever held in the
+server's memory in full.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Optional, Tuple, Type, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from alt_az import AltAzGrid
+from bright_stars_process import fetch_bright_star_catalog
+from constants import dots_per_inch
+from graphics_context import BaseComponent, GraphicsContext, GraphicsRecording
+from holder import Holder
+from render_cache import RenderCache, normalise_settings
+from starwheel import StarWheel
+from stick_figures_process import fetch_stick_figures
+from text import text
+from themes import themes
+
+# The components which may be requested, indexed by the name used in URLs
+components: Dict[str, Type[BaseComponent]] = {
+    "starwheel": StarWheel,
+    "holder": Holder,
+    "altaz": AltAzGrid
+}
+
+# The MIME type of each image format
+content_types: Dict[str, str] = {
+    "pdf": "application/pdf",
+    "png": "image/png",
+    "svg": "image/svg+xml"
+}
+
+# The range of latitudes, and of resolutions, which may be requested
+latitude_range: Tuple[float, float] = (10, 85)
+dots_per_inch_range: Tuple[float, float] = (20, 600)
+
+# The size of the pieces in which images are read from the cache and written to the network
+chunk_size: int = 64 * 1024
+
+# The maximum length of the request line and headers
+max_header_bytes: int = 16 * 1024
+
+# The cache of rendered images used by this process
+render_cache: Optional[RenderCache] = None
+
+
+class RequestError(Exception):
+    """
+    An error in an HTTP request, which is reported to the client with a particular status code.
+    """
+
+    def __init__(self, status: int, message: str):
+        """
+        An error in an HTTP request, which is reported to the client with a particular status code.
+
+        :param status:
+            The HTTP status code
+        :param message:
+            A description of the error
+        """
+        super().__init__(message)
+        self.status: int = status
+        self.message: str = message
+
+
+def fetch_server_arguments() -> Dict[str, Union[int, str]]:
+    """
+    Read the command-line options for the render server.
+
+    :return:
+        Dictionary of command-line arguments
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', dest='host', default="127.0.0.1",
+                        help="The network address to listen on.")
+    parser.add_argument('--port', dest='port', type=int, default=8080,
+                        help="The TCP port to listen on.")
+    parser.add_argument('--workers', dest='workers', type=int, default=0,
+                        help="The number of worker processes to render images with. Zero means one per CPU core.")
+    parser.add_argument('--max-pending', dest='max_pending', type=int, default=64,
+                        help="The maximum number of requests which may be waiting for a worker at once. Further "
+                             "requests are turned away until the backlog clears.")
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=256,
+                        help="The maximum size of the cache of rendered images, megabytes.")
+    args = parser.parse_args()
+
+    return {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers if args.workers > 0 else (os.cpu_count() or 1),
+        "max_pending": args.max_pending,
+        "cache_size": args.cache_size
+    }
+
+
+def initialise_worker(cache_bytes: int) -> None:
+    """
+    Prepare a freshly started worker process to render images, by loading everything that rendering needs into
+    memory before the first request arrives.
+
+    :param cache_bytes:
+        The maximum size of the cache of rendered images, bytes
+    :return:
+        None
+    """
+    global render_cache
+    render_cache = RenderCache(max_bytes=cache_bytes, component_types=components.values())
+
+    # Read the star catalogue and the constellation stick figures
+    fetch_bright_star_catalog()
+    fetch_stick_figures()
+
+    # Load the font used for text, by measuring a string with it
+    with GraphicsRecording(bounding_box={'x_min': 0, 'x_max': 0.01, 'y_min': 0, 'y_max': 0.01}) as page:
+        with GraphicsContext(page=page) as context:
+            context.measure_text(text="0")
+
+
+def render_component(name: str, settings: dict, img_format: str, resolution: float) -> str:
+    """
+    Render an image of a component into the cache, unless it is already there. This runs in a worker process, and
+    passes back only the filename of the image, rather than its contents.
+
+    :param name:
+        The name of the component, as used in URLs
+    :param settings:
+        The settings of the component
+    :param img_format:
+        The format of the image
+    :param resolution:
+        The resolution of the image, dots per inch
+    :return:
+        The filename of the image in the cache
+    """
+    component: BaseComponent = components[name](settings=settings)
+    return render_cache.render(component=component, img_format=img_format, dots_per_inch=resolution)
+
+
+def parse_request_target(target: str) -> Tuple[str, dict, str, float]:
+    """
+    Work out which image has been requested from the target of an HTTP request.
+
+    :param target:
+        The request target, e.g. </starwheel.png?latitude=52>
+    :return:
+        The name of the component, its settings, the image format, and the resolution in dots per inch
+    """
+    url = urlsplit(target)
+    path: str = unquote(url.path).strip("/")
+    query: Dict[str, str] = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    # Look up the component and image format
+    name, _, img_format = path.rpartition(".")
+    if name not in components or img_format not in content_types:
+        raise RequestError(404, "No such image <{}>. Request one of {} in one of the formats {}.".format(
+            path, ", ".join(components), ", ".join(content_types)))
+
+    # Check the latitude, which must be a whole number of degrees, since that is how it is printed on the holder
+    try:
+        latitude: float = float(query.get('latitude', "52"))
+        resolution: float = float(query.get('dpi', dots_per_inch))
+    except ValueError:
+        raise RequestError(400, "The latitude and resolution must be numbers.")
+    if not latitude.is_integer():
+        raise RequestError(400, "The latitude must be a whole number of degrees.")
+    if not latitude_range[0] <= abs(latitude) <= latitude_range[1]:
+        raise RequestError(400, "The latitude must be between {:.0f} and {:.0f} degrees, north or south.".format(
+            *latitude_range))
+
+    # Vector images have no resolution, so ignore whatever was requested, to avoid caching duplicate copies
+    if img_format != "png":
+        resolution = dots_per_inch
+    elif not dots_per_inch_range[0] <= resolution <= dots_per_inch_range[1]:
+        raise RequestError(400, "The resolution must be between {:.0f} and {:.0f} dots per inch.".format(
+            *dots_per_inch_range))
+
+    language: str = query.get('language', "en")
+    theme: str = query.get('theme', "default")
+    if language not in text:
+        raise RequestError(400, "No such language <{}>. Request one of {}.".format(language, ", ".join(text)))
+    if theme not in themes:
+        raise RequestError(400, "No such theme <{}>. Request one of {}.".format(theme, ", ".join(themes)))
+
+    settings: dict = normalise_settings({
+        'latitude': latitude,
+        'language': language,
+        'theme': theme
+    })
+
+    return name, settings, img_format, resolution
+
+
+class RenderServer:
+    """
+    An HTTP server which passes requests for images to a pool of worker processes.
+    """
+
+    def __init__(self, workers: int, max_pending: int, cache_bytes: int):
+        """
+        An HTTP server which passes requests for images to a pool of worker processes.
+
+        :param workers:
+            The number of worker processes to render images with
+        :param max_pending:
+            The maximum number of requests which may be waiting for a worker at once
+        :param cache_bytes:
+            The maximum size of the cache of rendered images, bytes
+        """
+        self.workers: int = workers
+        self.max_pending: int = max_pending
+        self.pending: int = 0
+        self.cache: RenderCache = RenderCache(max_bytes=cache_bytes, component_types=components.values())
+        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=workers,
+                                                                 initializer=initialise_worker,
+                                                                 initargs=(cache_bytes,))
+
+        # Only pass as many requests to the pool as there are workers, so that the backlog is held here, where it can
+        # be measured and limited
+        self.render_slots: asyncio.Semaphore = asyncio.Semaphore(workers)
+
+    async def start(self) -> None:
+        """
+        Start all the worker processes, so that the first requests do not have to wait for them.
+
+        :return:
+            None
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, os.getpid) for _ in range(self.workers)])
+
+    def close(self) -> None:
+        """
+        Shut down the worker processes.
+
+        :return:
+            None
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def render(self, name: str, settings: dict, img_format: str, resolution: float) -> BinaryIO:
+        """
+        Open an image in the cache, rendering it in a worker process first if it is not already there.
+
+        :param name:
+            The name of the component, as used in URLs
+        :param settings:
+            The settings of the component
+        :param img_format:
+            The format of the image
+        :param resolution:
+            The resolution of the image, dots per inch
+        :return:
+            The image file, open for reading. The caller must close it.
+        """
+        loop = asyncio.get_running_loop()
+
+        # Popular images are answered straight from the cache, without waiting for a worker. Looking them up touches
+        # files on disk, so is done on a thread, to avoid holding up other connections.
+        image: Optional[BinaryIO] = await loop.run_in_executor(None, self.open_cached,
+                                                               name, settings, img_format, resolution)
+        if image is not None:
+            return image
+
+        # Turn requests away, rather than letting an unbounded backlog build up. <pending> counts the requests being
+        # rendered, as well as those waiting for a worker.
+        if self.pending >= self.workers + self.max_pending:
+            raise RequestError(503, "The server is busy. Please try again later.")
+
+        self.pending += 1
+        try:
+            async with self.render_slots:
+                # The worker writes the image straight into the cache, and passes back only its filename
+                filename: str = await loop.run_in_executor(self.executor, render_component,
+                                                           name, settings, img_format, resolution)
+        finally:
+            self.pending -= 1
+
+        return await loop.run_in_executor(None, open, filename, "rb")
+
+    def open_cached(self, name: str, settings: dict, img_format: str, resolution: float) -> Optional[BinaryIO]:
+        """
+        Open an image in the cache, if it has already been rendered.
+
+        :param name:
+            The name of the component, as used in URLs
+        :param settings:
+            The settings of the component
+        :param img_format:
+            The format of the image
+        :param resolution:
+            The resolution of the image, dots per inch
+        :return:
+            The image file, open for reading, or None if it is not in the cache
+        """
+        key: str = self.cache.key(component=components[name](settings=settings), img_format=img_format,
+                                  dots_per_inch=resolution)
+        filename: Optional[str] = self.cache.lookup(key=key, img_format=img_format)
+        if filename is None:
+            return None
+
+        try:
+            return open(filename, "rb")
+        except FileNotFoundError:
+            # Another process may have evicted the image since we looked it up
+            return None
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer a single HTTP request, and then close the connection.
+
+        :param reader:
+            The stream from which the request is read
+        :param writer:
+            The stream to which the response is written
+        :return:
+            None
+        """
+        target: str = ""
+        image: Optional[BinaryIO] = None
+        try:
+            try:
+                # Read the request line and headers. We do not need anything from the headers.
+                try:
+                    header: bytes = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.LimitOverrunError:
+                    raise RequestError(431, "The request headers are too long.")
+                request_line: str = header.split(b"\r\n", 1)[0].decode("latin-1")
+                words = request_line.split(" ")
+                if len(words) != 3:
+                    raise RequestError(400, "Malformed request.")
+                method, target, version = words
+                if method not in ("GET", "HEAD"):
+                    raise RequestError(405, "Only GET and HEAD requests are supported.")
+
+                # Fetch or render the requested image
+                name, settings, img_format, resolution = parse_request_target(target=target)
+                image = await self.render(name=name, settings=settings, img_format=img_format,
+                                          resolution=resolution)
+            except RequestError as error:
+                await self.respond(writer=writer, status=error.status, content_type="text/plain; charset=utf-8",
+                                   data="{}\n".format(error.message).encode("utf-8"))
+                return
+            except asyncio.IncompleteReadError:
+                # The client went away before finishing its request
+                return
+            except Exception:
+                logging.exception("Failed to render <{}>".format(target))
+                await self.respond(writer=writer, status=500, content_type="text/plain; charset=utf-8",
+                                   data=b"The image could not be rendered.\n")
+                return
+
+            await self.respond_with_file(writer=writer, content_type=content_types[img_format], image=image,
+                                         send_body=(method == "GET"))
+        except ConnectionError:
+            # The client went away before we finished writing the response
+            pass
+        finally:
+            if image is not None:
+                image.close()
+            writer.close()
+
+    @staticmethod
+    def write_headers(writer: asyncio.StreamWriter, status: int, content_type: str, content_length: int) -> None:
+        """
+        Write the status line and headers of an HTTP response.
+
+        :param writer:
+            The stream to which the response is written
+        :param status:
+            The HTTP status code
+        :param content_type:
+            The MIME type of the body
+        :param content_length:
+            The length of the body, bytes
+        :return:
+            None
+        """
+        reasons: Dict[int, str] = {
+            200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            431: "Request Header Fields Too Large", 500: "Internal Server Error", 503: "Service Unavailable"
+        }
+
+        writer.write("HTTP/1.1 {:d} {}\r\n"
+                     "Content-Type: {}\r\n"
+                     "Content-Length: {:d}\r\n"
+                     "Connection: close\r\n"
+                     "\r\n".format(status, reasons[status], content_type, content_length).encode("latin-1"))
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: int, content_type: str, data: bytes) -> None:
+        """
+        Write a short HTTP response, such as an error message, which is held in memory.
+
+        :param writer:
+            The stream to which the response is written
+        :param status:
+            The HTTP status code
+        :param content_type:
+            The MIME type of the body
+        :param data:
+            The body of the response
+        :return:
+            None
+        """
+        RenderServer.write_headers(writer=writer, status=status, content_type=content_type, content_length=len(data))
+        writer.write(data)
+        await writer.drain()
+
+    @staticmethod
+    async def respond_with_file(writer: asyncio.StreamWriter, content_type: str, image: BinaryIO,
+                                send_body: bool) -> None:
+        """
+        Write a successful HTTP response containing an image file. The file is streamed from disk in pieces, and
+        each piece is only read once the previous one has drained, so at most one piece of the image is held in
+        memory for each connection.
+
+        :param writer:
+            The stream to which the response is written
+        :param content_type:
+            The MIME type of the image
+        :param image:
+            The image file, open for reading
+        :param send_body:
+            If False, only send the headers, e.g. in response to a HEAD request
+        :return:
+            None
+        """
+        loop = asyncio.get_running_loop()
+
+        RenderServer.write_headers(writer=writer, status=200, content_type=content_type,
+                                   content_length=os.fstat(image.fileno()).st_size)
+
+        while send_body:
+            piece: bytes = await loop.run_in_executor(None, image.read, chunk_size)
+            if not piece:
+                break
+            writer.write(piece)
+            await writer.drain()
+        await writer.drain()
+
+
+async def serve(host: str, port: int, workers: int, max_pending: int, cache_bytes: int) -> None:
+    """
+    Run the render server until it is interrupted.
+
+    :param host:
+        The network address to listen on
+    :param port:
+        The TCP port to listen on
+    :param workers:
+        The number of worker processes to render images with
+    :param max_pending:
+        The maximum number of requests which may be waiting for a worker at once
+    :param cache_bytes:
+        The maximum size of the cache of rendered images, bytes
+    :return:
+        None
+    """
+    render_server: RenderServer = RenderServer(workers=workers, max_pending=max_pending, cache_bytes=cache_bytes)
+    try:
+        await render_server.start()
+        server = await asyncio.start_server(render_server.handle_connection, host=host, port=port,
+                                            limit=max_header_bytes)
+        logging.info("Serving planisphere components on <http://{}:{:d}/>".format(host, port))
+        async with server:
+            await server.serve_forever()
+    finally:
+        render_server.close()
+
+
+# Do it right away if we're run as a script
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+
+    # Fetch command line arguments passed to us
+    arguments: Dict[str, Union[int, str]] = fetch_server_arguments()
+
+    try:
+        asyncio.run(serve(host=arguments['host'], port=arguments['port'], workers=arguments['workers'],
+                          max_pending=arguments['max_pending'], cache_bytes=arguments['cache_size'] * 1024 ** 2))
+    except KeyboardInterrupt:
+        pass
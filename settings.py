@@ -25,12 +25,14 @@ import argparse
 from typing import Dict, Union
 
 
-def fetch_command_line_arguments(default_filename: str = '') -> Dict[str, Union[int, str]]:
+def command_line_parser(default_filename: str = '') -> argparse.ArgumentParser:
     """
-    Read input parameters from the command line
+    Create a parser for the command-line options which are shared between all the scripts.
 
+    :param default_filename:
+        The filename to use for output, if none is specified on the command line
     :return:
-        Dictionary of command-line arguments
+        argparse.ArgumentParser instance, to which scripts may add further options of their own
     """
 
     parser = argparse.ArgumentParser(description=__doc__)
@@ -42,7 +44,18 @@ def fetch_command_line_arguments(default_filename: str = '') -> Dict[str, Union[
                         help="Filename for output, without a file type suffix.")
     parser.add_argument('--theme', dest='theme', choices=["default", "dark"], default="default",
                         help="Color theme to be used in the planisphere.")
-    args = parser.parse_args()
+    return parser
+
+
+def fetch_command_line_arguments(default_filename: str = '') -> Dict[str, Union[int, str]]:
+    """
+    Read input parameters from the command line
+
+    :return:
+        Dictionary of command-line arguments
+    """
+
+    args = command_line_parser(default_filename=default_filename).parse_args()
 
     return {
         "latitude": args.latitude,
@@ -23,15 +23,19 @@ Render the star wheel for the planisphere.
 
 import re
 
+import numpy as np
+
 from math import pi, sin, cos, atan2, hypot
 from numpy import arange
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 
 import calendar
-from bright_stars_process import fetch_bright_star_list
-from constants import unit_deg, unit_rev, unit_mm, unit_cm, r_1, r_gap, central_hole_size, radius
+from bright_stars_process import StarCatalog, fetch_bright_star_catalog
+from constants import unit_deg, unit_rev, unit_mm, r_1, r_gap, central_hole_size, radius, declination
+from constants import radius_array
 from graphics_context import BaseComponent, GraphicsContext
 from settings import fetch_command_line_arguments
+from stick_figures_process import fetch_projected_stick_figures
 from text import text
 from themes import themes
 
@@ -47,6 +51,16 @@ class StarWheel(BaseComponent):
         """
         return "star_wheel"
 
+    def source_files(self) -> List[str]:
+        """
+        Return the files which the star wheel is drawn from.
+        """
+        return super().source_files() + [
+            "bright_stars_process.py", "calendar.py", "stick_figures_process.py",
+            "raw_data/bright_star_catalog.dat", "raw_data/bright_star_names.dat",
+            "raw_data/constellation_stick_figures.dat", "raw_data/constellation_names.dat"
+        ]
+
     def bounding_box(self, settings: dict) -> Dict[str, float]:
         """
         Return the bounding box of the canvas area used by this component.
@@ -63,6 +77,25 @@ class StarWheel(BaseComponent):
             'y_max': r_1 + 4 * unit_mm
         }
 
+    def region_is_blank(self, settings: dict, region: Dict[str, float]) -> bool:
+        """
+        Report whether nothing at all is drawn within a rectangular area of the canvas. Nothing is drawn outside the
+        outer edge of the star wheel.
+
+        :param settings:
+            A dictionary of settings required by the renderer.
+        :param region:
+            Dictionary with the elements 'x_min', 'x_max', 'y_min' and 'y_max' set to the area of canvas, metres
+        :return:
+            Boolean flag indicating that the area is certainly blank
+        """
+
+        # Find the point in the region which is closest to the centre of the star wheel, and allow a margin for the
+        # width of the line around the edge
+        x: float = min(max(0, region['x_min']), region['x_max'])
+        y: float = min(max(0, region['y_min']), region['y_max'])
+        return hypot(x, y) > r_1 + 1 * unit_mm
+
     def do_rendering(self, settings: dict, context: GraphicsContext) -> None:
         """
         This method is required to actually render this item.
@@ -80,134 +113,25 @@ class StarWheel(BaseComponent):
         latitude: float = abs(settings['latitude'])
         theme: Dict[str, Tuple[float, float, float, float]] = themes[settings['theme']]
 
-        context.set_font_size(1.2)
-
         # Radius of outer edge of star chart
         r_2: float = r_1 - r_gap
 
-        # Radius of day-of-month ticks from centre of star chart
-        r_3: float = r_1 * 0.1 + r_2 * 0.9
-
-        # Radius of every fifth day-of-month tick from centre of star chart
-        r_4: float = r_1 * 0.2 + r_2 * 0.8
-
-        # Radius of lines between months on date scale
-        r_5: float = r_1
-
-        # Radius for writing numeric labels for days of the month
-        r_6: float = r_1 * 0.4 + r_2 * 0.6
-
-        # Shade background to month scale
-        shading_inner_radius: float = r_1 * 0.55 + r_2 * 0.45
-        context.begin_path()
-        context.circle(centre_x=0, centre_y=0, radius=r_1)
-        context.circle(centre_x=0, centre_y=0, radius=shading_inner_radius)
-        context.fill(color=theme['shading'])
+        # Draw the star chart, which is the same in every language, so is only drawn once per latitude, and then
+        # reused for each translation
+        context.paint_layer(key=("StarWheel", "star_chart", latitude, is_southern, settings['theme']),
+                            bounding_box=self.bounding_box(settings=settings),
+                            renderer=lambda layer_context: self.draw_star_chart(context=layer_context,
+                                                                                latitude=latitude,
+                                                                                is_southern=is_southern,
+                                                                                theme=theme))
 
-        # Draw the outer edge of planisphere
+        # Text is clipped to the edge of the planisphere, excluding the central hole, like the star chart
         context.begin_path()
         context.circle(centre_x=0, centre_y=0, radius=r_1)
-        context.fill(color=theme['background'])
-
-        # Draw the central hole in the middle of the planisphere
         context.begin_sub_path()
         context.circle(centre_x=0, centre_y=0, radius=central_hole_size)
-        context.stroke(color=theme['edge'])
-
-        # Combine these two paths to make a clipping path for drawing the star wheel
         context.clip()
 
-        # Draw lines of constant declination at 15 degree intervals.
-        dec: float
-        for dec in arange(-80, 85, 15):
-            # Convert declination into radius from the centre of the planisphere
-            r: float = radius(dec=dec, latitude=latitude)
-            if r > r_2:
-                continue
-            context.begin_path()
-            context.circle(centre_x=0, centre_y=0, radius=r)
-            context.stroke(color=theme['grid'])
-
-        # Draw constellation stick figures
-        with open("raw_data/constellation_stick_figures.dat", "rt") as f_in:
-            for line in f_in:
-                line: str = line.strip()
-
-                # Ignore blank lines and comment lines
-                if (len(line) == 0) or (line[0] == '#'):
-                    continue
-
-                # Split line into words.
-                # These are the names of the constellations, and the start and end points for each stroke.
-                name: str
-                ra1_str: str
-                dec1_str: str
-                ra2_str: str
-                dec2_str: str
-                name, ra1_str, dec1_str, ra2_str, dec2_str = line.split()
-
-                dec1: float = float(dec1_str)
-                ra1: float = float(ra1_str)
-                dec2: float = float(dec2_str)
-                ra2: float = float(ra2_str)
-
-                # In the southern hemisphere, we flip the sky upside down
-                if is_southern:
-                    dec1 *= -1
-                    ra1 *= -1
-                    dec2 *= -1
-                    ra2 *= -1
-
-                # Project RA and Dec into radius and azimuth in the planispheric projection
-                r_point_1: float = radius(dec=float(dec1), latitude=latitude)
-                if r_point_1 > r_2:
-                    continue
-
-                r_point_2: float = radius(dec=float(dec2), latitude=latitude)
-                if r_point_2 > r_2:
-                    continue
-
-                p1: Tuple[float, float] = (-r_point_1 * cos(float(ra1) * unit_deg),
-                                           -r_point_1 * sin(float(ra1) * unit_deg))
-                p2: Tuple[float, float] = (-r_point_2 * cos(float(ra2) * unit_deg),
-                                           -r_point_2 * sin(float(ra2) * unit_deg))
-
-                # Impose a maximum length of 4 cm on constellation stick figures; they get quite distorted at the edge
-                if hypot(p2[0] - p1[0], p2[1] - p1[1]) > 4 * unit_cm:
-                    continue
-
-                # Stroke a line
-                context.begin_path()
-                context.move_to(x=p1[0], y=p1[1])
-                context.line_to(x=p2[0], y=p2[1])
-                context.stroke(color=theme['stick'], line_width=1, dotted=True)
-
-        # Draw stars from Yale Bright Star Catalogue
-        for star_descriptor in fetch_bright_star_list()['stars'].values():
-            ra, dec, mag = star_descriptor[:3]
-
-            # Discard stars fainter than mag 4
-            if mag == "-" or float(mag) > 4.0:
-                continue
-
-            ra = float(ra)
-            dec = float(dec)
-
-            # If we're making a southern hemisphere planisphere, we flip the sky upside down
-            if is_southern:
-                ra *= -1
-                dec *= -1
-
-            r: float = radius(dec=dec, latitude=latitude)
-            if r > r_2:
-                continue
-
-            # Represent each star with a small circle
-            context.begin_path()
-            context.circle(centre_x=-r * cos(ra * unit_deg), centre_y=-r * sin(ra * unit_deg),
-                           radius=0.18 * unit_mm * (5 - mag))
-            context.fill(color=theme['star'])
-
         # Write constellation names
         context.set_font_size(0.7)
         context.set_color(theme['constellation'])
@@ -245,6 +169,140 @@ class StarWheel(BaseComponent):
                 a: float = atan2(p[0], p[1])
                 context.text(text=name2, x=p[0], y=p[1], h_align=0, v_align=0, gap=0, rotation=unit_rev / 2 - a)
 
+        # Draw the calendar ring, which is the same at all latitudes, so is only drawn once per language and
+        # hemisphere, and then reused
+        context.paint_layer(key=("StarWheel", "calendar_ring", language, is_southern, settings['theme']),
+                            bounding_box=self.bounding_box(settings=settings),
+                            renderer=lambda layer_context: self.draw_calendar_ring(context=layer_context,
+                                                                                   language=language,
+                                                                                   is_southern=is_southern,
+                                                                                   theme=theme))
+
+    @staticmethod
+    def draw_star_chart(context: GraphicsContext, latitude: float, is_southern: bool,
+                        theme: Dict[str, Tuple[float, float, float, float]]) -> None:
+        """
+        Draw the parts of the star wheel which do not depend on the language: the background, the lines of
+        constant declination, the constellation stick figures and the stars.
+
+        :param context:
+            A GraphicsContext object to use for drawing
+        :param latitude:
+            The absolute latitude of the planisphere, degrees
+        :param is_southern:
+            Boolean flag indicating whether the planisphere is for the southern hemisphere
+        :param theme:
+            The color theme of the planisphere
+        :return:
+            None
+        """
+
+        # Radius of outer edge of star chart
+        r_2: float = r_1 - r_gap
+
+        # Shade background to month scale
+        shading_inner_radius: float = r_1 * 0.55 + r_2 * 0.45
+        context.begin_path()
+        context.circle(centre_x=0, centre_y=0, radius=r_1)
+        context.circle(centre_x=0, centre_y=0, radius=shading_inner_radius)
+        context.fill(color=theme['shading'])
+
+        # Draw the outer edge of planisphere
+        context.begin_path()
+        context.circle(centre_x=0, centre_y=0, radius=r_1)
+        context.fill(color=theme['background'])
+
+        # Draw the central hole in the middle of the planisphere
+        context.begin_sub_path()
+        context.circle(centre_x=0, centre_y=0, radius=central_hole_size)
+        context.stroke(color=theme['edge'])
+
+        # Combine these two paths to make a clipping path for drawing the star wheel
+        context.clip()
+
+        # Draw lines of constant declination at 15 degree intervals.
+        dec: float
+        for dec in arange(-80, 85, 15):
+            # Convert declination into radius from the centre of the planisphere
+            r: float = radius(dec=dec, latitude=latitude)
+            if r > r_2:
+                continue
+            context.begin_path()
+            context.circle(centre_x=0, centre_y=0, radius=r)
+            context.stroke(color=theme['grid'])
+
+        # Draw constellation stick figures, which have already been projected for this latitude. They are all
+        # stroked together as a single path.
+        with context.batch():
+            segment: List[float]
+            for segment in fetch_projected_stick_figures(latitude=latitude, is_southern=is_southern).tolist():
+                context.batch_line(x0=segment[0], y0=segment[1], x1=segment[2], y1=segment[3],
+                                   color=theme['stick'], line_width=1, dotted=True)
+
+        # Draw stars from Yale Bright Star Catalogue, discarding stars fainter than mag 4, and only looking at the
+        # declinations which fall within the star chart (plus a small margin)
+        dec_edge: float = declination(r=r_2, latitude=latitude) - 1
+        star_catalog: StarCatalog = fetch_bright_star_catalog()
+        if not is_southern:
+            star_selection: np.ndarray = star_catalog.query(mag_max=4.0, dec_min=dec_edge)
+        else:
+            star_selection = star_catalog.query(mag_max=4.0, dec_max=-dec_edge)
+        star_ra: np.ndarray = star_catalog.ra[star_selection]
+        star_dec: np.ndarray = star_catalog.dec[star_selection]
+        star_mag: np.ndarray = star_catalog.mag[star_selection]
+
+        # If we're making a southern hemisphere planisphere, we flip the sky upside down
+        if is_southern:
+            star_ra = -star_ra
+            star_dec = -star_dec
+
+        # Discard stars which fall outside the star chart
+        star_r: np.ndarray = radius_array(dec=star_dec, latitude=latitude)
+        visible_stars: np.ndarray = star_r <= r_2
+
+        star_x: np.ndarray = (-star_r * np.cos(star_ra * unit_deg))[visible_stars]
+        star_y: np.ndarray = (-star_r * np.sin(star_ra * unit_deg))[visible_stars]
+        star_size: np.ndarray = (0.18 * unit_mm * (5 - star_mag))[visible_stars]
+
+        # Represent each star with a small circle. These are all filled together as a single path.
+        with context.batch():
+            for x, y, size in zip(star_x.tolist(), star_y.tolist(), star_size.tolist()):
+                context.batch_circle(centre_x=x, centre_y=y, radius=size, color=theme['star'])
+
+    @staticmethod
+    def draw_calendar_ring(context: GraphicsContext, language: str, is_southern: bool,
+                           theme: Dict[str, Tuple[float, float, float, float]]) -> None:
+        """
+        Draw the ring around the edge of the star wheel which shows the days of the year. This does not depend on
+        the latitude of the planisphere.
+
+        :param context:
+            A GraphicsContext object to use for drawing
+        :param language:
+            The language to use for the names of the months
+        :param is_southern:
+            Boolean flag indicating whether the planisphere is for the southern hemisphere
+        :param theme:
+            The color theme of the planisphere
+        :return:
+            None
+        """
+
+        # Radius of outer edge of star chart
+        r_2: float = r_1 - r_gap
+
+        # Radius of day-of-month ticks from centre of star chart
+        r_3: float = r_1 * 0.1 + r_2 * 0.9
+
+        # Radius of every fifth day-of-month tick from centre of star chart
+        r_4: float = r_1 * 0.2 + r_2 * 0.8
+
+        # Radius of lines between months on date scale
+        r_5: float = r_1
+
+        # Radius for writing numeric labels for days of the month
+        r_6: float = r_1 * 0.4 + r_2 * 0.6
+
         # Calendar ring counts clockwise in northern hemisphere; anticlockwise in southern hemisphere
         s: int = -1 if not is_southern else 1
 
@@ -0,0 +1,112 @@
+# stick_figures_process.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+This script reads the list of line segments which make up the constellation stick figures, and projects them onto
+the star wheel. Both the parsed list and the projected segments are kept in memory, so that the many star wheels
+drawn for each latitude -- in different languages, themes and image formats -- do not recompute them.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import numpy as np
+
+from constants import unit_deg, unit_cm, r_2, radius_array
+
+# The file that the stick figures are read from
+stick_figures_source: str = "raw_data/constellation_stick_figures.dat"
+
+# Maximum length of a stick figure line segment on the star wheel; they get quite distorted at the edge
+maximum_segment_length: float = 4 * unit_cm
+
+# Stick figures that have already been read, indexed by filename
+stick_figure_lists: Dict[str, np.ndarray] = {}
+
+# Projected stick figures, indexed by latitude and hemisphere. The least recently used are discarded when there are
+# more than <projected_stick_figure_cache_size>.
+projected_stick_figure_lists: "OrderedDict[Tuple[float, bool], np.ndarray]" = OrderedDict()
+projected_stick_figure_cache_size: int = 32
+
+
+def fetch_stick_figures(filename: str = stick_figures_source) -> np.ndarray:
+    """
+    Read the list of line segments which make up the constellation stick figures.
+
+    :param filename:
+        The filename of the list of stick figures
+    :return:
+        Array with one row for each line segment, containing its start and end points as [RA1, Dec1, RA2, Dec2],
+        all in degrees
+    """
+
+    if filename not in stick_figure_lists:
+        # Each line contains the name of a constellation, and the start and end points for a single stroke
+        segments: np.ndarray = np.loadtxt(filename, comments="#", usecols=(1, 2, 3, 4), dtype=float, ndmin=2)
+        segments.flags.writeable = False
+        stick_figure_lists[filename] = segments
+
+    return stick_figure_lists[filename]
+
+
+def fetch_projected_stick_figures(latitude: float, is_southern: bool) -> np.ndarray:
+    """
+    Return the line segments of the constellation stick figures, projected onto the star wheel for a particular
+    latitude. Segments which extend beyond the edge of the star wheel, or which are too distorted to be worth
+    drawing, are discarded.
+
+    :param latitude:
+        The absolute latitude of the planisphere, degrees
+    :param is_southern:
+        Boolean flag indicating whether the planisphere is for the southern hemisphere
+    :return:
+        Array with one row for each line segment, containing its start and end points as [x1, y1, x2, y2], metres
+    """
+
+    key: Tuple[float, bool] = (latitude, is_southern)
+    if key in projected_stick_figure_lists:
+        projected_stick_figure_lists.move_to_end(key)
+        return projected_stick_figure_lists[key]
+
+    segments: np.ndarray = fetch_stick_figures()
+    ra: np.ndarray = segments[:, 0::2]
+    dec: np.ndarray = segments[:, 1::2]
+
+    # In the southern hemisphere, we flip the sky upside down
+    if is_southern:
+        ra = -ra
+        dec = -dec
+
+    # Project RA and Dec into radius and azimuth in the planispheric projection
+    r: np.ndarray = radius_array(dec=dec, latitude=latitude)
+    x: np.ndarray = -r * np.cos(ra * unit_deg)
+    y: np.ndarray = -r * np.sin(ra * unit_deg)
+
+    # Keep only segments which lie entirely within the star wheel, and which are not too long
+    length: np.ndarray = np.hypot(x[:, 1] - x[:, 0], y[:, 1] - y[:, 0])
+    selection: np.ndarray = np.all(r <= r_2, axis=1) & (length <= maximum_segment_length)
+
+    projected: np.ndarray = np.column_stack((x[:, 0], y[:, 0], x[:, 1], y[:, 1]))[selection]
+    projected.flags.writeable = False
+    projected_stick_figure_lists[key] = projected
+
+    # Discard the least recently used projections
+    while len(projected_stick_figure_lists) > projected_stick_figure_cache_size:
+        projected_stick_figure_lists.popitem(last=False)
+
+    return projected
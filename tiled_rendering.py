@@ -0,0 +1,545 @@
+#!/usr/bin/python3
+# tiled_rendering.py
+# -*- coding: utf-8 -*-
+#
+# The python script in this file makes the various parts of a model planisphere.
+#
+# Copyright (C) 2014-2024 Dominic Ford <https://dcford.org.uk/>
+#
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# You should have received a copy of the GNU General Public License along with
+# this file; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+# ----------------------------------------------------------------------------
+
+"""
+Render components of the planisphere as very large PNG images, e.g. for printing posters at 1200 dpi or more, or as
+pyramids of small tiles at many zoom levels, for viewing on the web.
+
+Rather than drawing the whole image onto a single bitmap in memory, the component is recorded once, and then
+replayed into tiles which are drawn in parallel on a pool of threads. Cairo surfaces must not be used by more than one
+thread at once, so each thread is given a copy of the recording of its own.
+
+When making a single large image, the tiles are drawn in order, a horizontal strip at a time, and each strip is encoded
+and written to the PNG file as soon as it is complete. Strips are made short enough that each holds no more pixels
+than one tile per thread, and only two tiles per thread are in progress at once, so the memory needed depends on the
+tile size and the number of threads, but not on the size of the image.
+"""
+
+import json
+import logging
+import os
+import struct
+import sys
+import zlib
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from math import ceil
+from queue import Queue
+from typing import BinaryIO, Deque, Dict, Iterator, List, Optional, Tuple, Type
+
+import numpy as np
+
+from alt_az import AltAzGrid
+from graphics_context import BaseComponent, GraphicsRecording, GraphicsTile
+from holder import Holder
+from settings import command_line_parser
+from starwheel import StarWheel
+
+# The components which may be rendered from the command line
+components: Dict[str, Type[BaseComponent]] = {
+    "starwheel": StarWheel,
+    "holder": Holder,
+    "altaz": AltAzGrid
+}
+
+# The default width and height of the tiles, pixels
+default_tile_size: int = 1024
+
+# The default width and height of the tiles in tile pyramids, pixels
+default_pyramid_tile_size: int = 256
+
+# The number of tiles per thread which may be in progress at once when making a single large image
+tiles_in_progress_per_thread: int = 2
+
+# The size of the pieces of compressed image data written to the PNG file, bytes
+png_chunk_size: int = 256 * 1024
+
+
+class PngWriter:
+    """
+    Write an 8-bit RGBA PNG image to a file a few rows at a time, so that the whole image never needs to be held in
+    memory.
+    """
+
+    def __init__(self, stream: BinaryIO, width: int, height: int, compression_level: int = 6):
+        """
+        Write an 8-bit RGBA PNG image to a file a few rows at a time, so that the whole image never needs to be held
+        in memory.
+
+        :param stream:
+            The binary file object to write the image to
+        :param width:
+            The width of the image, pixels
+        :param height:
+            The height of the image, pixels
+        :param compression_level:
+            The zlib compression level, 0-9
+        """
+        self.stream: BinaryIO = stream
+        self.width: int = width
+        self.height: int = height
+        self.rows_written: int = 0
+        self.compressor = zlib.compressobj(level=compression_level)
+        self.buffer: bytearray = bytearray()
+
+        # PNG signature, followed by a header declaring 8 bits per channel, RGBA color, no interlacing
+        self.stream.write(b"\x89PNG\r\n\x1a\n")
+        self.write_chunk(tag=b"IHDR", data=struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+    def write_chunk(self, tag: bytes, data: bytes) -> None:
+        """
+        Write a single chunk of the PNG file.
+
+        :param tag:
+            The four-letter type of the chunk
+        :param data:
+            The contents of the chunk
+        :return:
+            None
+        """
+        self.stream.write(struct.pack(">I", len(data)))
+        self.stream.write(tag)
+        self.stream.write(data)
+        self.stream.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag))))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        """
+        Append rows of pixels to the image.
+
+        :param rows:
+            Array of shape (number of rows, width, 4) containing unpremultiplied 8-bit RGBA pixels
+        :return:
+            None
+        """
+        assert rows.shape[1:] == (self.width, 4), "Rows of the wrong width"
+        assert self.rows_written + rows.shape[0] <= self.height, "Too many rows"
+
+        # Apply the PNG <Sub> filter to each row, which stores each pixel as its difference from the pixel to its
+        # left. This compresses much better than the raw pixels.
+        flat: np.ndarray = rows.reshape((rows.shape[0], self.width * 4))
+        filtered: np.ndarray = np.empty((rows.shape[0], self.width * 4 + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:5] = flat[:, :4]
+        np.subtract(flat[:, 4:], flat[:, :-4], out=filtered[:, 5:])
+
+        self.buffer += self.compressor.compress(filtered.tobytes())
+        self.rows_written += rows.shape[0]
+
+        # Write out the compressed data in reasonably sized pieces
+        while len(self.buffer) >= png_chunk_size:
+            self.write_chunk(tag=b"IDAT", data=bytes(self.buffer[:png_chunk_size]))
+            del self.buffer[:png_chunk_size]
+
+    def close(self) -> None:
+        """
+        Write the remainder of the compressed image data, and the end of the PNG file. The stream is left open.
+
+        :return:
+            None
+        """
+        assert self.rows_written == self.height, "Image closed before all its rows were written"
+
+        self.buffer += self.compressor.flush()
+        self.write_chunk(tag=b"IDAT", data=bytes(self.buffer))
+        self.buffer = bytearray()
+        self.write_chunk(tag=b"IEND", data=b"")
+
+
+def unpremultiply(data: memoryview, stride: int, width: int, height: int) -> np.ndarray:
+    """
+    Convert pixels from cairo's native ARGB32 format into the unpremultiplied RGBA format used in PNG files, in the
+    same way as cairo does when it writes PNG files itself.
+
+    :param data:
+        The pixel data, as returned by <GraphicsTile.pixels>
+    :param stride:
+        The number of bytes between the starts of consecutive rows
+    :param width:
+        The width of the image, pixels
+    :param height:
+        The height of the image, pixels
+    :return:
+        Array of shape (height, width, 4) containing 8-bit RGBA pixels
+    """
+
+    # Each pixel is a native-endian 32-bit integer, with alpha in the most significant byte
+    argb: np.ndarray = np.frombuffer(data, dtype=np.uint8).reshape((height, stride))[:, :width * 4]
+    argb = argb.reshape((height, width, 4))
+    channels: List[int] = [2, 1, 0, 3] if sys.byteorder == "little" else [1, 2, 3, 0]
+
+    rgba: np.ndarray = argb[:, :, channels].astype(np.uint32)
+    alpha: np.ndarray = rgba[:, :, 3:]
+
+    # Divide the color channels by alpha, rounding to the nearest integer. Fully transparent pixels are black.
+    rgba[:, :, :3] = np.where(alpha > 0, (rgba[:, :, :3] * 255 + alpha // 2) // np.maximum(alpha, 1), 0)
+    return rgba.astype(np.uint8)
+
+
+def render_tile(recording: GraphicsRecording, x: int, y: int, width: int, height: int,
+                dots_per_inch: float) -> np.ndarray:
+    """
+    Replay a recorded component into a single tile of a larger image.
+
+    :param recording:
+        The recorded component
+    :param x:
+        The position of the left edge of the tile within the image, pixels
+    :param y:
+        The position of the top edge of the tile within the image, pixels
+    :param width:
+        The width of the tile, pixels
+    :param height:
+        The height of the tile, pixels
+    :param dots_per_inch:
+        The resolution of the image
+    :return:
+        Array of shape (height, width, 4) containing 8-bit RGBA pixels
+    """
+    with GraphicsTile(width=width, height=height, dots_per_inch=dots_per_inch) as tile:
+        recording.replay(page=tile, offset_x=-x / tile.dots_per_metre, offset_y=-y / tile.dots_per_metre)
+        data, stride = tile.pixels()
+        return unpremultiply(data=data, stride=stride, width=width, height=height)
+
+
+def record_for_threads(component: BaseComponent, threads: int) -> "Queue[GraphicsRecording]":
+    """
+    Record a component once, and make a copy of the recording for each thread which will replay it. The copies share
+    no cairo surfaces, with each other or with any other drawing, so each can be replayed on a different thread at the
+    same time. Only the copying is done once per thread; the component itself is drawn just once.
+
+    :param component:
+        The component to record
+    :param threads:
+        The number of threads which will replay the recordings
+    :return:
+        Queue of recordings, from which each thread takes one while it is replaying it
+    """
+    recordings: "Queue[GraphicsRecording]" = Queue()
+    recording: GraphicsRecording = component.render_to_recording(share_layers=False)
+
+    try:
+        for _ in range(threads):
+            recordings.put(recording.copy())
+    finally:
+        recording.close()
+
+    return recordings
+
+
+def close_recordings(recordings: "Queue[GraphicsRecording]") -> None:
+    """
+    Discard all the recordings made by <record_for_threads>, once all the threads have finished with them.
+
+    :param recordings:
+        Queue of recordings
+    :return:
+        None
+    """
+    while not recordings.empty():
+        recordings.get().close()
+
+
+def render_tile_on_thread(recordings: "Queue[GraphicsRecording]", x: int, y: int, width: int, height: int,
+                          dots_per_inch: float) -> np.ndarray:
+    """
+    Replay a recorded component into a single tile of a larger image, using a recording which no other thread is
+    using at the same time.
+
+    :param recordings:
+        Queue of recordings, as returned by <record_for_threads>
+    :param x:
+        The position of the left edge of the tile within the image, pixels
+    :param y:
+        The position of the top edge of the tile within the image, pixels
+    :param width:
+        The width of the tile, pixels
+    :param height:
+        The height of the tile, pixels
+    :param dots_per_inch:
+        The resolution of the image
+    :return:
+        Array of shape (height, width, 4) containing 8-bit RGBA pixels
+    """
+    recording: GraphicsRecording = recordings.get()
+    try:
+        return render_tile(recording=recording, x=x, y=y, width=width, height=height, dots_per_inch=dots_per_inch)
+    finally:
+        recordings.put(recording)
+
+
+def render_tiled_png(component: BaseComponent, filename: Optional[str] = None, dots_per_inch: float = 1200,
+                     tile_size: int = default_tile_size, threads: Optional[int] = None) -> str:
+    """
+    Render a component as a PNG image, drawing it in tiles on a pool of threads, and writing each strip of tiles to
+    the file as soon as it is complete. The file is complete and closed by the time this method returns.
+
+    Each strip holds no more pixels than <threads> tiles, and at most <tiles_in_progress_per_thread> tiles per thread
+    are in progress at once. Counting the copies made while converting and encoding the pixels, the memory needed is
+    roughly 70 bytes for each of <threads> x <tile_size> x <tile_size> pixels, however large the image.
+
+    :param component:
+        The component to render
+    :param filename:
+        The filename of the image file to create (without file type stub)
+    :param dots_per_inch:
+        The dots per inch resolution to render the image
+    :param tile_size:
+        The width and height of the tiles, pixels
+    :param threads:
+        The number of threads to draw tiles on. By default, one per CPU core.
+    :return:
+        The filename of the image file we produced
+    """
+
+    # If no filename is specified, then use the component's default
+    if filename is None:
+        filename = component.default_filename()
+    output: str = "{}.png".format(filename)
+    tmp_output: str = "{}.tmp{:d}".format(output, os.getpid())
+
+    # Work out the size of the image, in the same way as <GraphicsPage>
+    bounding_box: Dict[str, float] = component.bounding_box(settings=component.settings)
+    dots_per_metre: float = dots_per_inch * 39.370079
+    width: int = int((bounding_box['x_max'] - bounding_box['x_min']) * dots_per_metre)
+    height: int = int((bounding_box['y_max'] - bounding_box['y_min']) * dots_per_metre)
+
+    logging.info("Creating file <{}>".format(output))
+
+    # Give each thread a recording of its own to draw tiles from
+    threads = threads or os.cpu_count() or 1
+    recordings: "Queue[GraphicsRecording]" = record_for_threads(component=component, threads=threads)
+
+    # Make the strips short enough that each holds no more pixels than one tile per thread, however wide the image
+    strip_height: int = max(1, min(tile_size, threads * tile_size * tile_size // max(width, 1)))
+    columns: List[int] = list(range(0, width, tile_size))
+    tile_positions: Iterator[Tuple[int, int]] = ((x, y) for y in range(0, height, strip_height) for x in columns)
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            def start_tile(position: Tuple[int, int]) -> Future:
+                # Start drawing a tile, which is no larger than <tile_size> by <strip_height>
+                x, y = position
+                return executor.submit(render_tile_on_thread, recordings, x, y, min(tile_size, width - x),
+                                       min(strip_height, height - y), dots_per_inch)
+
+            with open(tmp_output, "wb") as f:
+                writer: PngWriter = PngWriter(stream=f, width=width, height=height)
+
+                # Keep a fixed number of tiles in progress, in the order they appear in the image, so the threads
+                # carry on drawing while each strip is written out
+                tiles: Deque[Future] = deque(
+                    start_tile(position)
+                    for position in islice(tile_positions, tiles_in_progress_per_thread * threads))
+                strip: List[np.ndarray] = []
+
+                while tiles:
+                    tile: Future = tiles.popleft()
+                    next_position: Optional[Tuple[int, int]] = next(tile_positions, None)
+                    if next_position is not None:
+                        tiles.append(start_tile(next_position))
+
+                    # Write out each strip as soon as all of its tiles are complete
+                    strip.append(tile.result())
+                    if len(strip) == len(columns):
+                        writer.write_rows(np.concatenate(strip, axis=1))
+                        strip = []
+
+                writer.close()
+    finally:
+        close_recordings(recordings=recordings)
+
+    os.replace(tmp_output, output)
+    return output
+
+
+def write_pyramid_tile(recordings: "Queue[GraphicsRecording]", filename: str, x: int, y: int, tile_size: int,
+                       dots_per_inch: float) -> None:
+    """
+    Replay a recorded component into a single tile of a tile pyramid, and save it as a PNG file. The file is written
+    under a temporary name and then moved into place, so an interrupted run never leaves a truncated tile behind.
+
+    :param recordings:
+        Queue of recordings of the component, as returned by <record_for_threads>
+    :param filename:
+        The filename of the PNG file to create
+    :param x:
+        The position of the left edge of the tile within the image at this zoom level, pixels
+    :param y:
+        The position of the top edge of the tile within the image at this zoom level, pixels
+    :param tile_size:
+        The width and height of the tile, pixels
+    :param dots_per_inch:
+        The resolution of the image at this zoom level
+    :return:
+        None
+    """
+    pixels: np.ndarray = render_tile_on_thread(recordings=recordings, x=x, y=y, width=tile_size, height=tile_size,
+                                               dots_per_inch=dots_per_inch)
+
+    # Each tile is written by a single thread, so the process ID is enough to make the temporary name unique
+    tmp_filename: str = "{}.tmp{:d}".format(filename, os.getpid())
+    with open(tmp_filename, "wb") as f:
+        writer: PngWriter = PngWriter(stream=f, width=tile_size, height=tile_size)
+        writer.write_rows(pixels)
+        writer.close()
+    os.replace(tmp_filename, filename)
+
+
+def render_tile_pyramid(component: BaseComponent, directory: Optional[str] = None, max_zoom: int = 5,
+                        tile_size: int = default_pyramid_tile_size, threads: Optional[int] = None) -> str:
+    """
+    Render a component as a pyramid of square PNG tiles, for display in a web-based map viewer. At zoom level 0 the
+    whole component fits within a single tile, and each subsequent zoom level doubles the resolution. The tile in
+    column <x> and row <y> at zoom level <z> is stored as <directory/z/x/y.png>. Tiles which the component reports as
+    blank are not rendered at all, and are missing from the pyramid.
+
+    The component is drawn only once, into a recording, and each thread replays its own copy of this recording into
+    every tile it draws.
+
+    :param component:
+        The component to render
+    :param directory:
+        The directory in which to create the tile pyramid
+    :param max_zoom:
+        The highest zoom level to render
+    :param tile_size:
+        The width and height of the tiles, pixels
+    :param threads:
+        The number of threads to draw tiles on. By default, one per CPU core.
+    :return:
+        The directory containing the tile pyramid
+    """
+
+    # If no directory is specified, then name it after the component's default filename
+    if directory is None:
+        directory = "{}_tiles".format(component.default_filename())
+
+    # At zoom level 0, the longer side of the component fills one tile
+    bounding_box: Dict[str, float] = component.bounding_box(settings=component.settings)
+    width: float = bounding_box['x_max'] - bounding_box['x_min']  # metres
+    height: float = bounding_box['y_max'] - bounding_box['y_min']  # metres
+    size: float = max(width, height)
+
+    logging.info("Creating tile pyramid <{}>".format(directory))
+
+    # Give each thread a recording of its own to draw tiles from
+    threads = threads or os.cpu_count() or 1
+    recordings: "Queue[GraphicsRecording]" = record_for_threads(component=component, threads=threads)
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            tiles: List[Future] = []
+            rendered: int = 0
+            skipped: int = 0
+
+            zoom: int
+            for zoom in range(max_zoom + 1):
+                dots_per_metre: float = tile_size * 2 ** zoom / size
+                tile_width: float = tile_size / dots_per_metre  # metres
+
+                column: int
+                for column in range(ceil(width / tile_width - 1e-9)):
+                    os.makedirs(os.path.join(directory, str(zoom), str(column)), exist_ok=True)
+
+                    row: int
+                    for row in range(ceil(height / tile_width - 1e-9)):
+                        # Skip tiles which fall in areas where nothing is drawn
+                        region: Dict[str, float] = {
+                            'x_min': bounding_box['x_min'] + column * tile_width,
+                            'x_max': bounding_box['x_min'] + (column + 1) * tile_width,
+                            'y_min': bounding_box['y_min'] + row * tile_width,
+                            'y_max': bounding_box['y_min'] + (row + 1) * tile_width
+                        }
+                        if component.region_is_blank(settings=component.settings, region=region):
+                            skipped += 1
+                            continue
+
+                        rendered += 1
+                        tiles.append(executor.submit(
+                            write_pyramid_tile, recordings,
+                            os.path.join(directory, str(zoom), str(column), "{:d}.png".format(row)),
+                            column * tile_size, row * tile_size, tile_size, dots_per_metre / 39.370079))
+
+            # Wait for all the tiles to be written, raising any exception which occurred
+            for tile in tiles:
+                tile.result()
+    finally:
+        close_recordings(recordings=recordings)
+
+    # Write a description of the pyramid for the viewer
+    description_filename: str = os.path.join(directory, "tiles.json")
+    tmp_description_filename: str = "{}.tmp{:d}".format(description_filename, os.getpid())
+    with open(tmp_description_filename, "wt") as f:
+        json.dump({
+            'tile_size': tile_size,
+            'max_zoom': max_zoom,
+            'width': ceil(width / size * tile_size * 2 ** max_zoom),
+            'height': ceil(height / size * tile_size * 2 ** max_zoom),
+            'url': "{z}/{x}/{y}.png"
+        }, f, indent=1)
+    os.replace(tmp_description_filename, description_filename)
+
+    logging.info("Rendered {:d} tiles, skipped {:d} blank tiles".format(rendered, skipped))
+    return directory
+
+
+# Do it right away if we're run as a script
+if __name__ == "__main__":
+    # Read command-line arguments
+    parser = command_line_parser(default_filename="")
+    parser.add_argument('--component', dest='component', choices=list(components), default="starwheel",
+                        help="The component to render.")
+    parser.add_argument('--dpi', dest='dots_per_inch', type=float, default=1200,
+                        help="The resolution of the image, dots per inch.")
+    parser.add_argument('--tile-size', dest='tile_size', type=int, default=default_tile_size,
+                        help="The width and height of the tiles the image is drawn in, pixels.")
+    parser.add_argument('--threads', dest='threads', type=int, default=0,
+                        help="The number of threads to draw tiles on. Zero means one per CPU core.")
+    parser.add_argument('--pyramid', dest='max_zoom', type=int, default=None,
+                        help="Instead of a single image, make a pyramid of {:d}-pixel tiles, with zoom levels "
+                             "from 0 up to this level. The output filename is used as the name of the directory "
+                             "to store the tiles in.".format(default_pyramid_tile_size))
+    args = parser.parse_args()
+    if args.img_format != "png":
+        parser.error("Tiled rendering can only produce PNG images")
+
+    component_to_render: BaseComponent = components[args.component](settings={
+        'latitude': args.latitude,
+        'language': 'en',
+        'theme': args.theme
+    })
+
+    # Render the component
+    if args.max_zoom is not None:
+        render_tile_pyramid(
+            component=component_to_render,
+            directory=args.filename or None,
+            max_zoom=args.max_zoom,
+            threads=args.threads or None
+        )
+    else:
+        render_tiled_png(
+            component=component_to_render,
+            filename=args.filename or None,
+            dots_per_inch=args.dots_per_inch,
+            tile_size=args.tile_size,
+            threads=args.threads or None
+        )